@@ -1,10 +1,19 @@
 import pytest
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from apps.albums.models import Album
 from apps.tracks.models import Track
 from apps.social.models import Group
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Evita que vetores de ranking em cache vazem entre testes."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def api_client():
     return APIClient()
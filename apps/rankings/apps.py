@@ -7,7 +7,7 @@ class RankingsConfig(AppConfig):
 
     def ready(self):
         try:
-            pass
+            from . import signals  # noqa: F401
         except Exception:
             import logging
 
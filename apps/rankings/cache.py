@@ -0,0 +1,215 @@
+import logging
+import time
+from array import array
+from collections import namedtuple
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import AlbumRanking, CountryGlobalRanking, TrackRanking
+
+logger = logging.getLogger(__name__)
+
+RankingVector = namedtuple("RankingVector", ["item_ids", "positions"])
+
+ALBUM_VERSION_KEY = "rankings:album_vector_version:{user_id}"
+ALBUM_VECTOR_KEY = "rankings:album_vector:{user_id}:v{version}"
+TRACK_VERSION_KEY = "rankings:track_vector_version:{user_id}:{album_id}"
+TRACK_VECTOR_KEY = "rankings:track_vector:{user_id}:{album_id}:v{version}"
+GLOBAL_RANKING_GENERATION_KEY = "rankings:global_ranking:generation"
+GLOBAL_RANKING_RESPONSE_KEY = "rankings:global_ranking:response:{token}:{variant}"
+
+
+def _timeout():
+    return getattr(settings, "RANKING_VECTOR_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def _empty_vector() -> RankingVector:
+    return RankingVector(array("l"), array("l"))
+
+
+def _new_version() -> int:
+    """
+    Versões começam em um valor baseado no relógio para que, se a chave de
+    versão for despejada do cache, um vetor antigo nunca seja reaproveitado.
+    """
+    return time.time_ns()
+
+
+def _get_versions(version_keys: Iterable[str]) -> Dict[str, int]:
+    version_keys = list(version_keys)
+    versions = cache.get_many(version_keys)
+    for key in version_keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def _bump_version(version_key: str):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, _new_version(), timeout=None)
+
+
+def _get_vectors(user_ids, version_key_for, vector_key_for, load_missing):
+    """
+    Lógica comum de leitura: resolve as versões atuais, busca os vetores em
+    lote no cache e carrega do banco (em uma única chamada) apenas os ausentes.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+
+    versions = _get_versions(version_key_for(uid) for uid in user_ids)
+    vector_keys = {
+        uid: vector_key_for(uid, versions[version_key_for(uid)]) for uid in user_ids
+    }
+    cached = cache.get_many(vector_keys.values())
+
+    vectors: Dict[int, RankingVector] = {}
+    missing = []
+    for uid in user_ids:
+        vector = cached.get(vector_keys[uid])
+        if vector is None:
+            missing.append(uid)
+        else:
+            vectors[uid] = vector
+
+    if missing:
+        loaded = load_missing(missing)
+        to_store = {}
+        for uid in missing:
+            vector = loaded.get(uid) or _empty_vector()
+            vectors[uid] = vector
+            to_store[vector_keys[uid]] = vector
+        cache.set_many(to_store, timeout=_timeout())
+
+    return vectors
+
+
+def _vectors_from_rows(rows) -> Dict[int, RankingVector]:
+    vectors: Dict[int, RankingVector] = {}
+    for user_id, item_id, position in rows:
+        vector = vectors.get(user_id)
+        if vector is None:
+            vector = vectors[user_id] = _empty_vector()
+        vector.item_ids.append(item_id)
+        vector.positions.append(position)
+    return vectors
+
+
+def get_album_vectors(user_ids) -> Dict[int, RankingVector]:
+    """
+    Retorna { user_id: RankingVector(album_ids, positions) }.
+    Os álbuns seguem a ordem padrão de Album (release_date), usada no desempate
+    dos cálculos de compatibilidade.
+    """
+
+    def load_missing(missing):
+        rows = (
+            AlbumRanking.objects.filter(user_id__in=missing)
+            .order_by("user_id", "album__release_date", "album_id")
+            .values_list("user_id", "album_id", "position")
+        )
+        return _vectors_from_rows(rows)
+
+    return _get_vectors(
+        user_ids,
+        lambda uid: ALBUM_VERSION_KEY.format(user_id=uid),
+        lambda uid, version: ALBUM_VECTOR_KEY.format(user_id=uid, version=version),
+        load_missing,
+    )
+
+
+def get_album_vector(user_id) -> RankingVector:
+    return get_album_vectors([user_id])[user_id]
+
+
+def get_track_vectors(user_ids, album_id) -> Dict[int, RankingVector]:
+    """
+    Retorna { user_id: RankingVector(track_ids, positions) } para um álbum,
+    com as músicas ordenadas por track_id.
+    """
+
+    def load_missing(missing):
+        rows = (
+            TrackRanking.objects.filter(user_id__in=missing, track__album_id=album_id)
+            .order_by("user_id", "track_id")
+            .values_list("user_id", "track_id", "position")
+        )
+        return _vectors_from_rows(rows)
+
+    return _get_vectors(
+        user_ids,
+        lambda uid: TRACK_VERSION_KEY.format(user_id=uid, album_id=album_id),
+        lambda uid, version: TRACK_VECTOR_KEY.format(
+            user_id=uid, album_id=album_id, version=version
+        ),
+        load_missing,
+    )
+
+
+def get_track_vector(user_id, album_id) -> RankingVector:
+    return get_track_vectors([user_id], album_id)[user_id]
+
+
+def invalidate_album_vector(user_id):
+    _bump_version(ALBUM_VERSION_KEY.format(user_id=user_id))
+    logger.debug("Vetor de álbuns invalidado para user_id=%s", user_id)
+
+
+def invalidate_track_vector(user_id, album_id):
+    _bump_version(TRACK_VERSION_KEY.format(user_id=user_id, album_id=album_id))
+    logger.debug(
+        "Vetor de músicas invalidado para user_id=%s album_id=%s", user_id, album_id
+    )
+
+
+def _global_ranking_cache_timeout():
+    return getattr(settings, "GLOBAL_RANKING_CACHE_TIMEOUT", 60 * 60)
+
+
+def refresh_global_ranking_generation():
+    """
+    Recalcula a geração dos rankings globais a partir do banco
+    (quantidade de países + maior updated_at) e a publica no cache.
+    Chamado pelo cálculo global após o commit, o que troca de uma vez a
+    chave das respostas em cache.
+    """
+    stats = CountryGlobalRanking.objects.aggregate(
+        total=Count("id"), last_modified=Max("updated_at")
+    )
+    last_modified = stats["last_modified"]
+    stamp = int(last_modified.timestamp() * 1_000_000) if last_modified else 0
+    generation = {
+        "token": f"{stats['total']}-{stamp}",
+        "last_modified": last_modified,
+    }
+    cache.set(
+        GLOBAL_RANKING_GENERATION_KEY, generation, _global_ranking_cache_timeout()
+    )
+    return generation
+
+
+def get_global_ranking_generation():
+    """Retorna {"token", "last_modified"} da geração atual dos rankings globais."""
+    generation = cache.get(GLOBAL_RANKING_GENERATION_KEY)
+    if generation is None:
+        generation = refresh_global_ranking_generation()
+    return generation
+
+
+def get_cached_global_ranking_response(token, variant):
+    return cache.get(GLOBAL_RANKING_RESPONSE_KEY.format(token=token, variant=variant))
+
+
+def set_cached_global_ranking_response(token, variant, data):
+    cache.set(
+        GLOBAL_RANKING_RESPONSE_KEY.format(token=token, variant=variant),
+        data,
+        _global_ranking_cache_timeout(),
+    )
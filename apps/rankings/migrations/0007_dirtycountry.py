@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rankings", "0006_notification"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirtyCountry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "country_name",
+                    models.CharField(
+                        max_length=100, unique=True, verbose_name="Nome do País"
+                    ),
+                ),
+                (
+                    "marked_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Marcado Em"),
+                ),
+            ],
+            options={
+                "verbose_name": "País com Ranking Pendente",
+                "verbose_name_plural": "Países com Ranking Pendente",
+            },
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("albums", "0001_initial"),
+        ("rankings", "0007_dirtycountry"),
+        ("tracks", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CountryAlbumStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "avg_rank",
+                    models.FloatField(null=True, verbose_name="Posição Média"),
+                ),
+                (
+                    "std_dev_rank",
+                    models.FloatField(default=0.0, verbose_name="Desvio Padrão"),
+                ),
+                ("votes", models.PositiveIntegerField(default=0, verbose_name="Votos")),
+                (
+                    "album",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="country_stats",
+                        to="albums.album",
+                        verbose_name="Álbum",
+                    ),
+                ),
+                (
+                    "country",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="album_stats",
+                        to="rankings.countryglobalranking",
+                        verbose_name="País",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Estatística de Álbum por País",
+                "verbose_name_plural": "Estatísticas de Álbuns por País",
+                "ordering": ["country", "avg_rank"],
+                "indexes": [
+                    models.Index(
+                        fields=["album", "avg_rank"],
+                        name="rankings_co_album_i_256f5e_idx",
+                    )
+                ],
+                "unique_together": {("country", "album")},
+            },
+        ),
+        migrations.CreateModel(
+            name="CountryTrackStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "avg_rank",
+                    models.FloatField(null=True, verbose_name="Posição Média"),
+                ),
+                (
+                    "std_dev_rank",
+                    models.FloatField(default=0.0, verbose_name="Desvio Padrão"),
+                ),
+                ("votes", models.PositiveIntegerField(default=0, verbose_name="Votos")),
+                (
+                    "album",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="country_track_stats",
+                        to="albums.album",
+                        verbose_name="Álbum",
+                    ),
+                ),
+                (
+                    "country",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="track_stats",
+                        to="rankings.countryglobalranking",
+                        verbose_name="País",
+                    ),
+                ),
+                (
+                    "track",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="country_stats",
+                        to="tracks.track",
+                        verbose_name="Música",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Estatística de Música por País",
+                "verbose_name_plural": "Estatísticas de Músicas por País",
+                "ordering": ["country", "album", "avg_rank"],
+                "indexes": [
+                    models.Index(
+                        fields=["track", "avg_rank"],
+                        name="rankings_co_track_i_8f6bef_idx",
+                    ),
+                    models.Index(
+                        fields=["album", "country"],
+                        name="rankings_co_album_i_ab04ea_idx",
+                    ),
+                ],
+                "unique_together": {("country", "track")},
+            },
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rankings", "0008_country_album_track_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GlobalRankingRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="Executado Em",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Execução do Ranking Global",
+                "verbose_name_plural": "Execuções do Ranking Global",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="CountryRankingSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "country_name",
+                    models.CharField(max_length=100, verbose_name="Nome do País"),
+                ),
+                (
+                    "user_count",
+                    models.IntegerField(default=0, verbose_name="Número de Usuários"),
+                ),
+                ("album_ids", models.BinaryField(verbose_name="Álbuns")),
+                ("avg_ranks", models.BinaryField(verbose_name="Posições Médias")),
+                ("std_dev_ranks", models.BinaryField(verbose_name="Desvios Padrão")),
+                ("votes", models.BinaryField(verbose_name="Votos")),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshots",
+                        to="rankings.globalrankingrun",
+                        verbose_name="Execução",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Snapshot de Ranking por País",
+                "verbose_name_plural": "Snapshots de Rankings por País",
+                "indexes": [
+                    models.Index(
+                        fields=["country_name", "run"],
+                        name="rankings_co_country_6f4552_idx",
+                    )
+                ],
+                "unique_together": {("run", "country_name")},
+            },
+        ),
+    ]
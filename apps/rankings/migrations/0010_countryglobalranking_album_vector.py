@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rankings", "0009_global_ranking_snapshots"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="countryglobalranking",
+            name="album_vector_ids",
+            field=models.BinaryField(
+                default=bytes, verbose_name="Vetor de Álbuns (int32 empacotado)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="countryglobalranking",
+            name="album_vector_ranks",
+            field=models.BinaryField(
+                default=bytes,
+                verbose_name="Vetor de Posições Médias (float64 empacotado)",
+            ),
+        ),
+    ]
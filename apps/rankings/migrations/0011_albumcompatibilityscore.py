@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rankings", "0010_countryglobalranking_album_vector"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlbumCompatibilityScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "percent",
+                    models.FloatField(default=0.0, verbose_name="Compatibilidade (%)"),
+                ),
+                (
+                    "shared_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Álbuns em Comum"
+                    ),
+                ),
+                (
+                    "report",
+                    models.JSONField(
+                        default=dict, verbose_name="Análise do Par (JSON)"
+                    ),
+                ),
+                (
+                    "is_stale",
+                    models.BooleanField(default=False, verbose_name="Desatualizado"),
+                ),
+                (
+                    "computed_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Calculado Em"
+                    ),
+                ),
+                (
+                    "user_high",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Usuário B",
+                    ),
+                ),
+                (
+                    "user_low",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Usuário A",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Compatibilidade de Álbuns Pré-calculada",
+                "verbose_name_plural": "Compatibilidades de Álbuns Pré-calculadas",
+                "indexes": [
+                    models.Index(
+                        fields=["user_high"], name="rankings_al_user_hi_8f215d_idx"
+                    )
+                ],
+                "unique_together": {("user_low", "user_high")},
+            },
+        ),
+    ]
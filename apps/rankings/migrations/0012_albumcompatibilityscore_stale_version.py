@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rankings", "0011_albumcompatibilityscore"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="albumcompatibilityscore",
+            name="stale_version",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Versão da Marcação"
+            ),
+        ),
+    ]
@@ -1,3 +1,8 @@
+import math
+import sys
+from array import array
+from bisect import bisect_left
+
 from django.db import models
 from apps.users.models import User
 from apps.albums.models import Album
@@ -67,6 +72,21 @@ class TrackRanking(models.Model):
         return f"{self.user.username}'s Track Ranking: {self.track.title} ({self.position}°)"
 
 
+def _pack(typecode, values):
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(typecode, data):
+    unpacked = array(typecode)
+    unpacked.frombytes(bytes(data))
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
+
+
 class CountryGlobalRanking(models.Model):
     """
     Armazena o resultado do cálculo global do ranking de álbuns para um país.
@@ -107,6 +127,13 @@ class CountryGlobalRanking(models.Model):
         default=dict, verbose_name="Dados Completos da Análise (JSON)"
     )
 
+    album_vector_ids = models.BinaryField(
+        default=bytes, verbose_name="Vetor de Álbuns (int32 empacotado)"
+    )
+    album_vector_ranks = models.BinaryField(
+        default=bytes, verbose_name="Vetor de Posições Médias (float64 empacotado)"
+    )
+
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -116,6 +143,256 @@ class CountryGlobalRanking(models.Model):
     def __str__(self):
         return f"Ranking de Álbuns: {self.country_name}"
 
+    def set_album_vector(self, album_ids, avg_ranks):
+        self.album_vector_ids = _pack("i", album_ids)
+        self.album_vector_ranks = _pack("d", avg_ranks)
+
+    def album_vector(self):
+        """
+        Retorna (album_ids, avg_ranks) na ordem padrão de Album (release_date),
+        gravados pelo cálculo global.
+        """
+        return _unpack("i", self.album_vector_ids), _unpack(
+            "d", self.album_vector_ranks
+        )
+
+
+class CountryAlbumStat(models.Model):
+    """
+    Estatísticas de um álbum em um país (versão normalizada de
+    CountryGlobalRanking.analysis_data). Populado pelo cálculo global.
+    """
+
+    country = models.ForeignKey(
+        CountryGlobalRanking,
+        on_delete=models.CASCADE,
+        related_name="album_stats",
+        verbose_name="País",
+    )
+    album = models.ForeignKey(
+        Album,
+        on_delete=models.CASCADE,
+        related_name="country_stats",
+        verbose_name="Álbum",
+    )
+    avg_rank = models.FloatField(null=True, verbose_name="Posição Média")
+    std_dev_rank = models.FloatField(default=0.0, verbose_name="Desvio Padrão")
+    votes = models.PositiveIntegerField(default=0, verbose_name="Votos")
+
+    class Meta:
+        verbose_name = "Estatística de Álbum por País"
+        verbose_name_plural = "Estatísticas de Álbuns por País"
+        unique_together = ("country", "album")
+        ordering = ["country", "avg_rank"]
+        indexes = [
+            models.Index(fields=["album", "avg_rank"]),
+        ]
+
+    def __str__(self):
+        return f"{self.album_id} em {self.country_id}: {self.avg_rank}"
+
+
+class CountryTrackStat(models.Model):
+    """
+    Estatísticas de uma música em um país (versão normalizada de
+    analysis_data["track_analysis_by_album"]). Populado pelo cálculo global.
+    """
+
+    country = models.ForeignKey(
+        CountryGlobalRanking,
+        on_delete=models.CASCADE,
+        related_name="track_stats",
+        verbose_name="País",
+    )
+    track = models.ForeignKey(
+        Track,
+        on_delete=models.CASCADE,
+        related_name="country_stats",
+        verbose_name="Música",
+    )
+    album = models.ForeignKey(
+        Album,
+        on_delete=models.CASCADE,
+        related_name="country_track_stats",
+        verbose_name="Álbum",
+    )
+    avg_rank = models.FloatField(null=True, verbose_name="Posição Média")
+    std_dev_rank = models.FloatField(default=0.0, verbose_name="Desvio Padrão")
+    votes = models.PositiveIntegerField(default=0, verbose_name="Votos")
+
+    class Meta:
+        verbose_name = "Estatística de Música por País"
+        verbose_name_plural = "Estatísticas de Músicas por País"
+        unique_together = ("country", "track")
+        ordering = ["country", "album", "avg_rank"]
+        indexes = [
+            models.Index(fields=["track", "avg_rank"]),
+            models.Index(fields=["album", "country"]),
+        ]
+
+    def __str__(self):
+        return f"{self.track_id} em {self.country_id}: {self.avg_rank}"
+
+
+class GlobalRankingRun(models.Model):
+    """Uma execução do cálculo global; agrupa os snapshots gravados por ela."""
+
+    created_at = models.DateTimeField(
+        default=timezone.now, db_index=True, verbose_name="Executado Em"
+    )
+
+    class Meta:
+        verbose_name = "Execução do Ranking Global"
+        verbose_name_plural = "Execuções do Ranking Global"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Execução {self.pk} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class CountryRankingSnapshot(models.Model):
+    """
+    Snapshot compacto das estatísticas de álbuns de um país em uma execução.
+    Cada coluna é um array empacotado (little-endian), alinhado por índice e
+    ordenado por album_id: int32 para ids/votos e float32 para média/desvio.
+    """
+
+    run = models.ForeignKey(
+        GlobalRankingRun,
+        on_delete=models.CASCADE,
+        related_name="snapshots",
+        verbose_name="Execução",
+    )
+    country_name = models.CharField(max_length=100, verbose_name="Nome do País")
+    user_count = models.IntegerField(default=0, verbose_name="Número de Usuários")
+    album_ids = models.BinaryField(verbose_name="Álbuns")
+    avg_ranks = models.BinaryField(verbose_name="Posições Médias")
+    std_dev_ranks = models.BinaryField(verbose_name="Desvios Padrão")
+    votes = models.BinaryField(verbose_name="Votos")
+
+    class Meta:
+        verbose_name = "Snapshot de Ranking por País"
+        verbose_name_plural = "Snapshots de Rankings por País"
+        unique_together = ("run", "country_name")
+        indexes = [
+            models.Index(fields=["country_name", "run"]),
+        ]
+
+    def __str__(self):
+        return f"Snapshot {self.country_name} (execução {self.run_id})"
+
+    @classmethod
+    def from_album_stats(cls, country_name, user_count, album_stats, **kwargs):
+        """album_stats: [{album_id, avg_position, std_dev, count}]"""
+        album_stats = sorted(album_stats, key=lambda stats: stats["album_id"])
+        return cls(
+            country_name=country_name,
+            user_count=user_count,
+            album_ids=_pack("i", (stats["album_id"] for stats in album_stats)),
+            avg_ranks=_pack(
+                "f",
+                (
+                    (
+                        stats["avg_position"]
+                        if stats["avg_position"] is not None
+                        else float("nan")
+                    )
+                    for stats in album_stats
+                ),
+            ),
+            std_dev_ranks=_pack("f", (stats["std_dev"] for stats in album_stats)),
+            votes=_pack("i", (stats["count"] for stats in album_stats)),
+            **kwargs,
+        )
+
+    def _row(self, index, album_ids, avg_ranks, std_dev_ranks, votes):
+        avg_rank = avg_ranks[index]
+        return {
+            "album_id": album_ids[index],
+            "avg_rank": None if math.isnan(avg_rank) else round(avg_rank, 2),
+            "std_dev_rank": round(std_dev_ranks[index], 2),
+            "votes": votes[index],
+        }
+
+    def _columns(self):
+        return (
+            _unpack("i", self.album_ids),
+            _unpack("f", self.avg_ranks),
+            _unpack("f", self.std_dev_ranks),
+            _unpack("i", self.votes),
+        )
+
+    def album_rows(self):
+        columns = self._columns()
+        return [self._row(index, *columns) for index in range(len(columns[0]))]
+
+    def album_row(self, album_id):
+        """Busca binária no array de álbuns; None se o álbum não estava no snapshot."""
+        columns = self._columns()
+        index = bisect_left(columns[0], album_id)
+        if index == len(columns[0]) or columns[0][index] != album_id:
+            return None
+        return self._row(index, *columns)
+
+
+class AlbumCompatibilityScore(models.Model):
+    """
+    Compatibilidade de álbuns pré-calculada para um par de usuários (amigos ou
+    membros de um mesmo grupo). O par é sempre gravado com user_low < user_high.
+    is_stale é marcado quando um dos dois altera seu ranking de álbuns, e
+    stale_version é incrementado a cada marcação para que um recálculo em
+    andamento não limpe uma marcação feita depois de ler os vetores.
+    """
+
+    user_low = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+", verbose_name="Usuário A"
+    )
+    user_high = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+", verbose_name="Usuário B"
+    )
+    percent = models.FloatField(default=0.0, verbose_name="Compatibilidade (%)")
+    shared_count = models.PositiveIntegerField(
+        default=0, verbose_name="Álbuns em Comum"
+    )
+    report = JSONField(default=dict, verbose_name="Análise do Par (JSON)")
+    is_stale = models.BooleanField(default=False, verbose_name="Desatualizado")
+    stale_version = models.PositiveIntegerField(
+        default=0, verbose_name="Versão da Marcação"
+    )
+    computed_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Calculado Em"
+    )
+
+    class Meta:
+        verbose_name = "Compatibilidade de Álbuns Pré-calculada"
+        verbose_name_plural = "Compatibilidades de Álbuns Pré-calculadas"
+        unique_together = ("user_low", "user_high")
+        indexes = [
+            models.Index(fields=["user_high"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user_low_id} x {self.user_high_id}: {self.percent}%"
+
+
+class DirtyCountry(models.Model):
+    """
+    Marca um país cujo ranking global precisa ser recalculado porque algum
+    usuário dele alterou seus rankings. Consumido pelo recálculo incremental.
+    """
+
+    country_name = models.CharField(
+        max_length=100, unique=True, verbose_name="Nome do País"
+    )
+    marked_at = models.DateTimeField(auto_now=True, verbose_name="Marcado Em")
+
+    class Meta:
+        verbose_name = "País com Ranking Pendente"
+        verbose_name_plural = "Países com Ranking Pendente"
+
+    def __str__(self):
+        return f"Recálculo pendente: {self.country_name}"
+
 
 class GroupRanking(models.Model):
     """Representa um álbum que foi adicionado a um grupo para fins de matching."""
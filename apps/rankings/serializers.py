@@ -1,55 +1,261 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
+from .signals import send_ranking_changed
 from .models import (
     AlbumRanking,
     TrackRanking,
     CountryGlobalRanking,
+    CountryAlbumStat,
+    CountryTrackStat,
     UserRanking,
     RankedTrack,
     GroupRanking,
 )
 from apps.albums.models import Album
+from apps.users.models import User
 from apps.tracks.models import Track
 from apps.social.models import Group
 from rest_framework.validators import UniqueTogetherValidator
 
 
+def _lock_user_rankings(user):
+    """
+    Trava a linha do usuário (SELECT ... FOR UPDATE) até o fim da transação
+    corrente, serializando submissões de ranking concorrentes do mesmo usuário.
+    """
+    User.objects.select_for_update().filter(pk=user.pk).values_list(
+        "pk", flat=True
+    ).first()
+
+
+def _check_album_ranking(rankings_data):
+    positions = [item["position"] for item in rankings_data]
+    if len(set(positions)) != len(positions):
+        raise serializers.ValidationError("As posições no ranking devem ser únicas.")
+
+    album_ids = [item["album"].id for item in rankings_data]
+    if len(set(album_ids)) != len(album_ids):
+        raise serializers.ValidationError(
+            "Cada álbum só pode aparecer uma vez no ranking."
+        )
+
+
+def _apply_album_ranking(user, rankings_data):
+    """
+    Aplica o novo ranking de álbuns como diferença em relação ao atual: remove
+    os álbuns que saíram, reposiciona os que mudaram de posição e insere os
+    novos. Deve rodar dentro de uma transação com o usuário travado.
+    Retorna (rankings na ordem enviada, ids dos álbuns alterados).
+    """
+    positions = [item["position"] for item in rankings_data]
+    album_ids = [item["album"].id for item in rankings_data]
+
+    current = {
+        ranking.album_id: ranking for ranking in AlbumRanking.objects.filter(user=user)
+    }
+    desired = {item["album"].id: item for item in rankings_data}
+
+    to_delete = [
+        ranking.id for album_id, ranking in current.items() if album_id not in desired
+    ]
+    to_update = [
+        ranking
+        for album_id, ranking in current.items()
+        if album_id in desired and ranking.position != desired[album_id]["position"]
+    ]
+    to_create = [
+        AlbumRanking(user=user, album=item["album"], position=item["position"])
+        for album_id, item in desired.items()
+        if album_id not in current
+    ]
+
+    if to_delete:
+        AlbumRanking.objects.filter(id__in=to_delete).delete()
+
+    if to_update:
+        # A constraint única (user, position) é verificada linha a
+        # linha: primeiro as linhas vão para posições temporárias
+        # acima de qualquer posição atual ou nova, depois para as finais.
+        temporary_base = max(
+            [ranking.position for ranking in current.values()] + positions
+        )
+        for offset, ranking in enumerate(to_update, start=1):
+            ranking.position = temporary_base + offset
+        AlbumRanking.objects.bulk_update(to_update, ["position"])
+
+        for ranking in to_update:
+            ranking.position = desired[ranking.album_id]["position"]
+        AlbumRanking.objects.bulk_update(to_update, ["position"])
+
+    if to_create:
+        AlbumRanking.objects.bulk_create(to_create)
+
+    created = {ranking.album_id: ranking for ranking in to_create}
+    ranking_objects = [
+        current.get(album_id) or created[album_id] for album_id in album_ids
+    ]
+    changed_album_ids = (
+        [album_id for album_id in current if album_id not in desired]
+        + [ranking.album_id for ranking in to_update]
+        + list(created)
+    )
+    return ranking_objects, changed_album_ids
+
+
+def _replace_track_rankings(user, album_ids, ranking_objects):
+    """
+    Substitui os rankings de músicas do usuário para os álbuns informados com
+    um único DELETE e um único INSERT em lote.
+    """
+    TrackRanking.objects.filter(user=user, track__album_id__in=album_ids).delete()
+    TrackRanking.objects.bulk_create(ranking_objects)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que não consulta o banco item a item: valida apenas
+    o formato do id, e o BulkRelatedListSerializer do serializer pai resolve
+    todos os ids da lista com uma única query id__in.
+    Fora de uma lista (many=True) não deve ser usado.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if self.pk_field is not None:
+            return self.pk_field.to_internal_value(data)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer que resolve os BulkPrimaryKeyRelatedField dos itens com uma
+    query por campo (in_bulk) e troca os ids pelas instâncias. Ids inexistentes
+    geram o mesmo erro do PrimaryKeyRelatedField, na posição do item.
+    Listas aninhadas que também usam BulkRelatedListSerializer (ex.: músicas
+    de cada álbum da importação) são resolvidas pela lista mais externa,
+    com uma única query por campo para todo o payload.
+    """
+
+    def _is_nested(self):
+        parent = self.parent
+        while parent is not None:
+            if isinstance(parent, BulkRelatedListSerializer):
+                return True
+            parent = parent.parent
+        return False
+
+    def _collect_references(self, child, items, errors, references):
+        for field_name, field in child.fields.items():
+            if field.read_only:
+                continue
+            if isinstance(field, BulkPrimaryKeyRelatedField):
+                for item, item_errors in zip(items, errors):
+                    if field.source in item:
+                        references.append((field, field_name, item, item_errors))
+            elif isinstance(field, BulkRelatedListSerializer):
+                for item, item_errors in zip(items, errors):
+                    nested = item.get(field.source) or []
+                    nested_errors = [{} for _ in nested]
+                    item_errors[field_name] = nested_errors
+                    self._collect_references(
+                        field.child, nested, nested_errors, references
+                    )
+
+    def _prune_errors(self, errors):
+        """Remove listas aninhadas sem erro; retorna True se sobrou algum."""
+        has_errors = False
+        for item_errors in errors:
+            for field_name, value in list(item_errors.items()):
+                if isinstance(value, list) and all(
+                    isinstance(entry, dict) for entry in value
+                ):
+                    if not self._prune_errors(value):
+                        del item_errors[field_name]
+                        continue
+                has_errors = True
+        return has_errors
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        if self._is_nested():
+            return items
+
+        errors = [{} for _ in items]
+        references = []
+        self._collect_references(self.child, items, errors, references)
+
+        by_field = {}
+        for reference in references:
+            by_field.setdefault(id(reference[0]), []).append(reference)
+
+        for field_references in by_field.values():
+            field = field_references[0][0]
+            pks = {item[field.source] for _, _, item, _ in field_references}
+            objects = field.get_queryset().in_bulk(pks)
+            for _, field_name, item, item_errors in field_references:
+                obj = objects.get(item[field.source])
+                if obj is None:
+                    item_errors[field_name] = [
+                        field.error_messages["does_not_exist"].format(
+                            pk_value=item[field.source]
+                        )
+                    ]
+                else:
+                    item[field.source] = obj
+
+        if self._prune_errors(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+
 class AlbumRankingItemSerializer(serializers.Serializer):
-    album_id = serializers.PrimaryKeyRelatedField(
+    album_id = BulkPrimaryKeyRelatedField(
         queryset=Album.objects.all(), source="album", write_only=True
     )
     position = serializers.IntegerField(min_value=1)
 
+    class Meta:
+        list_serializer_class = BulkRelatedListSerializer
+
 
 class AlbumRankingSerializer(serializers.Serializer):
     rankings = AlbumRankingItemSerializer(many=True)
 
     def create(self, validated_data, user):
+        """
+        Aplica o novo ranking como diferença em relação ao atual, em uma única
+        transação. Reordenações (o caso mais comum, vindo do drag-and-drop)
+        viram apenas UPDATEs, sem apagar e recriar as linhas.
+        Se algo mudou, dispara ranking_changed uma única vez com os álbuns afetados.
+        """
         rankings_data = validated_data.pop("rankings")
-        ranking_objects = []
-
-        AlbumRanking.objects.filter(user=user).delete()
-
-        positions = [item["position"] for item in rankings_data]
-        if len(set(positions)) != len(positions):
-            raise serializers.ValidationError(
-                "As posições no ranking devem ser únicas."
-            )
+        _check_album_ranking(rankings_data)
 
-        for item in rankings_data:
-            ranking_objects.append(
-                AlbumRanking(user=user, album=item["album"], position=item["position"])
+        with transaction.atomic():
+            _lock_user_rankings(user)
+            ranking_objects, changed_album_ids = _apply_album_ranking(
+                user, rankings_data
             )
+            send_ranking_changed(type(self), user, album_ids=changed_album_ids)
 
-        AlbumRanking.objects.bulk_create(ranking_objects)
         return ranking_objects
 
 
 class TrackRankingItemSerializer(serializers.Serializer):
-    track_id = serializers.PrimaryKeyRelatedField(
+    track_id = BulkPrimaryKeyRelatedField(
         queryset=Track.objects.all(), source="track", write_only=True
     )
     position = serializers.IntegerField(min_value=1)
 
+    class Meta:
+        list_serializer_class = BulkRelatedListSerializer
+
 
 class TrackRankingSerializer(serializers.Serializer):
     album_id = serializers.PrimaryKeyRelatedField(queryset=Album.objects.all())
@@ -69,13 +275,8 @@ class TrackRankingSerializer(serializers.Serializer):
                 {"positions": ["As posições no ranking de músicas devem ser únicas."]}
             )
 
-        track_ids = [
-            item["track"].id if hasattr(item["track"], "id") else item["track"]
-            for item in rankings_data
-        ]
-        valid_tracks = Track.objects.filter(album=album, id__in=track_ids).count()
-
-        if valid_tracks != len(track_ids):
+        tracks = [item["track"] for item in rankings_data]
+        if any(track.album_id != album.id for track in tracks):
             raise serializers.ValidationError(
                 {
                     "tracks": [
@@ -84,29 +285,149 @@ class TrackRankingSerializer(serializers.Serializer):
                 }
             )
 
-        TrackRanking.objects.filter(user=user, track__album=album).delete()
+        if len({track.id for track in tracks}) != len(tracks):
+            raise serializers.ValidationError(
+                {"tracks": ["Cada música só pode aparecer uma vez no ranking."]}
+            )
+
+        ranking_objects = [
+            TrackRanking(user=user, track=item["track"], position=item["position"])
+            for item in rankings_data
+        ]
+
+        with transaction.atomic():
+            _lock_user_rankings(user)
+            _replace_track_rankings(user, [album.id], ranking_objects)
+            send_ranking_changed(type(self), user, track_album_ids=[album.id])
+
+        return ranking_objects
+
+
+class TrackRankingImportSerializer(serializers.Serializer):
+    album_id = BulkPrimaryKeyRelatedField(
+        queryset=Album.objects.all(), source="album", write_only=True
+    )
+    rankings = TrackRankingItemSerializer(many=True, allow_empty=False)
 
-        ranking_objects = []
-        for item in rankings_data:
-            track = (
-                item["track"]
-                if hasattr(item["track"], "id")
-                else Track.objects.get(id=item["track"])
+    class Meta:
+        list_serializer_class = BulkRelatedListSerializer
+
+
+class RankingImportSerializer(serializers.Serializer):
+    """
+    Importação em lote: ranking de álbuns + rankings de músicas de vários
+    álbuns em um único payload. Os ids são resolvidos pelos
+    BulkRelatedListSerializer (uma query por campo para todo o payload) e a
+    gravação acontece em uma única transação com um único ranking_changed.
+    """
+
+    albums = AlbumRankingItemSerializer(many=True, required=False)
+    tracks = TrackRankingImportSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        album_items = attrs.get("albums")
+        track_sections = attrs.get("tracks", [])
+        if album_items is None and not track_sections:
+            raise serializers.ValidationError(
+                "Envie ao menos um ranking de álbuns ou de músicas."
             )
-            ranking_objects.append(
-                TrackRanking(user=user, track=track, position=item["position"])
+
+        errors = {}
+        if album_items is not None:
+            try:
+                _check_album_ranking(album_items)
+            except serializers.ValidationError as e:
+                errors["albums"] = e.detail
+
+        track_errors = []
+        seen_albums = set()
+        for section in track_sections:
+            album = section["album"]
+            items = section["rankings"]
+            if album.id in seen_albums:
+                track_errors.append(
+                    f'O álbum "{album.title}" aparece mais de uma vez na importação.'
+                )
+                continue
+            seen_albums.add(album.id)
+
+            positions = [item["position"] for item in items]
+            tracks = [item["track"] for item in items]
+            if len(set(positions)) != len(positions):
+                track_errors.append(
+                    f'As posições no ranking de músicas do álbum "{album.title}" devem ser únicas.'
+                )
+            elif len({track.id for track in tracks}) != len(tracks):
+                track_errors.append(
+                    f'Cada música do álbum "{album.title}" só pode aparecer uma vez no ranking.'
+                )
+            elif any(track.album_id != album.id for track in tracks):
+                track_errors.append(
+                    f'Uma ou mais músicas enviadas não pertencem ao álbum "{album.title}".'
+                )
+        if track_errors:
+            errors["tracks"] = track_errors
+
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        attrs["tracks"] = {
+            section["album"].id: [
+                (item["track"], item["position"]) for item in section["rankings"]
+            ]
+            for section in track_sections
+        }
+        return attrs
+
+    def create(self, validated_data, user):
+        album_items = validated_data.get("albums")
+        track_rankings = validated_data["tracks"]
+
+        ranking_objects = [
+            TrackRanking(user=user, track=track, position=position)
+            for items in track_rankings.values()
+            for track, position in items
+        ]
+
+        changed_album_ids = []
+        with transaction.atomic():
+            _lock_user_rankings(user)
+            if album_items is not None:
+                _, changed_album_ids = _apply_album_ranking(user, album_items)
+            if track_rankings:
+                _replace_track_rankings(user, list(track_rankings), ranking_objects)
+            send_ranking_changed(
+                type(self),
+                user,
+                album_ids=changed_album_ids,
+                track_album_ids=list(track_rankings),
             )
 
-        TrackRanking.objects.bulk_create(ranking_objects)
-        return ranking_objects
+        return {
+            "albums": len(album_items or []),
+            "track_albums": len(track_rankings),
+            "tracks": len(ranking_objects),
+        }
 
 
 class CountryGlobalRankingSerializer(serializers.ModelSerializer):
+    """
+    Aceita o kwarg opcional `fields` para limitar os campos serializados
+    (ex: COUNTRY_RANKING_SUMMARY_FIELDS para o modo resumo do mapa).
+    """
+
     consensus_album_title = serializers.ReadOnlyField(source="consensus_album.title")
     polarization_album_title = serializers.ReadOnlyField(
         source="polarization_album.title"
     )
 
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     class Meta:
         model = CountryGlobalRanking
         fields = (
@@ -123,17 +444,58 @@ class CountryGlobalRankingSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+COUNTRY_RANKING_SUMMARY_FIELDS = tuple(
+    field
+    for field in CountryGlobalRankingSerializer.Meta.fields
+    if field != "analysis_data"
+)
+
+
+class CountryAlbumStatSerializer(serializers.ModelSerializer):
+    country_name = serializers.ReadOnlyField(source="country.country_name")
+    album_title = serializers.ReadOnlyField(source="album.title")
+
+    class Meta:
+        model = CountryAlbumStat
+        fields = (
+            "country_name",
+            "album_id",
+            "album_title",
+            "avg_rank",
+            "std_dev_rank",
+            "votes",
+        )
+        read_only_fields = fields
+
+
+class CountryTrackStatSerializer(serializers.ModelSerializer):
+    country_name = serializers.ReadOnlyField(source="country.country_name")
+    track_title = serializers.ReadOnlyField(source="track.title")
+
+    class Meta:
+        model = CountryTrackStat
+        fields = (
+            "country_name",
+            "album_id",
+            "track_id",
+            "track_title",
+            "avg_rank",
+            "std_dev_rank",
+            "votes",
+        )
+        read_only_fields = fields
+
+
 class RankedTrackSerializer(serializers.ModelSerializer):
     """Serializer para receber e exibir a posição de uma track."""
 
-    track_id = serializers.PrimaryKeyRelatedField(
-        queryset=Track.objects.all(), source="track"
-    )
+    track_id = BulkPrimaryKeyRelatedField(queryset=Track.objects.all(), source="track")
     title = serializers.CharField(source="track.title", read_only=True)
 
     class Meta:
         model = RankedTrack
         fields = ("track_id", "position", "title")
+        list_serializer_class = BulkRelatedListSerializer
 
 
 class UserRankingCreateSerializer(serializers.Serializer):
@@ -1,49 +1,116 @@
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from .models import AlbumRanking, TrackRanking
-from .tasks import run_global_ranking_calculation
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from .cache import (
+    invalidate_album_vector,
+    invalidate_track_vector,
+)
+from .tasks import (
+    GLOBAL_RANKING_SCHEDULED_KEY,
+    enqueue_compatibility_refresh,
+    record_coalesced_signal,
+    run_incremental_global_ranking_calculation,
+)
+from .utils import mark_compatibility_scores_stale, mark_countries_dirty
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Evento de domínio disparado uma única vez por submissão de ranking, dentro
+# da transação da escrita. O sender é o serializer que gravou e os kwargs são
+# user_id, country, album_ids (álbuns cuja posição no ranking de álbuns mudou)
+# e track_album_ids (álbuns cujo ranking de músicas foi regravado).
+# Receivers que dependem do commit usam transaction.on_commit.
+ranking_changed = Signal()
+
+
+def send_ranking_changed(sender, user, album_ids=(), track_album_ids=()):
+    """Dispara ranking_changed para uma submissão de ranking já gravada."""
+    album_ids = list(dict.fromkeys(album_ids))
+    track_album_ids = list(dict.fromkeys(track_album_ids))
+    if not album_ids and not track_album_ids:
+        return
+    logger.debug(
+        "Signal: ranking_changed sender=%s user_id=%s albums=%s track_albums=%s",
+        sender.__name__,
+        user.id,
+        len(album_ids),
+        len(track_album_ids),
+    )
+    ranking_changed.send(
+        sender=sender,
+        user_id=user.id,
+        country=getattr(user, "country", None),
+        album_ids=album_ids,
+        track_album_ids=track_album_ids,
+    )
+
 
 def enqueue_global_ranking_task():
+    """
+    Agenda o recálculo incremental com atraso de GLOBAL_RANKING_DEBOUNCE_SECONDS.
+    Enquanto houver uma tarefa pendente, novos signals são apenas contabilizados
+    e absorvidos por ela. Retorna True se uma nova tarefa foi enfileirada.
+    """
+    window = getattr(settings, "GLOBAL_RANKING_DEBOUNCE_SECONDS", 30)
+    lock_timeout = window + getattr(settings, "GLOBAL_RANKING_SCHEDULE_GRACE", 300)
+
+    if not cache.add(GLOBAL_RANKING_SCHEDULED_KEY, True, timeout=lock_timeout):
+        coalesced = record_coalesced_signal()
+        logger.debug(
+            "run_incremental_global_ranking_calculation já agendada; %s signal(s) agrupado(s).",
+            coalesced,
+        )
+        return False
+
     try:
-        run_global_ranking_calculation.delay()
-        logger.info("Enfileirada run_global_ranking_calculation via signal.")
+        run_incremental_global_ranking_calculation.apply_async(countdown=window)
+        logger.info(
+            "Enfileirada run_incremental_global_ranking_calculation via signal (countdown=%ss).",
+            window,
+        )
+        return True
     except Exception:
+        cache.delete(GLOBAL_RANKING_SCHEDULED_KEY)
         logger.exception(
-            "Falha ao enfileirar run_global_ranking_calculation via signal."
+            "Falha ao enfileirar run_incremental_global_ranking_calculation via signal."
         )
+        return False
 
 
-@receiver(post_save, sender=AlbumRanking)
-def album_ranking_saved(sender, instance, created, **kwargs):
-    logger.debug(
-        "Signal: AlbumRanking saved id=%s created=%s",
-        getattr(instance, "id", None),
-        created,
-    )
-    enqueue_global_ranking_task()
+@receiver(ranking_changed)
+def schedule_global_ranking(sender, user_id, country, **kwargs):
+    """
+    Marca o país do usuário como pendente (na mesma transação da escrita) e
+    agenda o recálculo incremental para depois do commit.
+    """
+    if not country:
+        return
 
+    mark_countries_dirty([country])
+    transaction.on_commit(enqueue_global_ranking_task)
 
-@receiver(post_delete, sender=AlbumRanking)
-def album_ranking_deleted(sender, instance, **kwargs):
-    logger.debug("Signal: AlbumRanking deleted id=%s", getattr(instance, "id", None))
-    enqueue_global_ranking_task()
 
+@receiver(ranking_changed)
+def invalidate_album_ranking_caches(sender, user_id, album_ids, **kwargs):
+    if not album_ids:
+        return
 
-@receiver(post_save, sender=TrackRanking)
-def track_ranking_saved(sender, instance, created, **kwargs):
-    logger.debug(
-        "Signal: TrackRanking saved id=%s created=%s",
-        getattr(instance, "id", None),
-        created,
-    )
-    enqueue_global_ranking_task()
+    mark_compatibility_scores_stale(user_id)
+    transaction.on_commit(lambda: invalidate_album_vector(user_id))
+    # Sempre agenda: um recálculo já em execução pode ter lido os vetores
+    # antigos, e a trava por usuário já agrupa submissões seguidas.
+    transaction.on_commit(lambda: enqueue_compatibility_refresh(user_id))
+
+
+@receiver(ranking_changed)
+def invalidate_track_ranking_caches(sender, user_id, track_album_ids, **kwargs):
+    if not track_album_ids:
+        return
 
+    def invalidate():
+        for album_id in track_album_ids:
+            invalidate_track_vector(user_id, album_id)
 
-@receiver(post_delete, sender=TrackRanking)
-def track_ranking_deleted(sender, instance, **kwargs):
-    logger.debug("Signal: TrackRanking deleted id=%s", getattr(instance, "id", None))
-    enqueue_global_ranking_task()
+    transaction.on_commit(invalidate)
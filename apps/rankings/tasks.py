@@ -1,11 +1,209 @@
+import logging
+import time
+
+from celery import chord
+from django.conf import settings
+from django.core.cache import cache
+
 from config.celery import app
-from .utils import calculate_global_ranking
+from .models import GlobalRankingRun
+from .utils import (
+    calculate_dirty_country_rankings,
+    calculate_global_ranking,
+    get_eligible_countries,
+    precompute_compatibility_scores,
+    prune_ranking_snapshots,
+    refresh_user_compatibility_scores,
+)
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RANKING_SCHEDULED_KEY = "rankings:global_ranking:scheduled"
+GLOBAL_RANKING_COALESCED_KEY = "rankings:global_ranking:coalesced_signals"
+GLOBAL_RANKING_COALESCED_TOTAL_KEY = "rankings:global_ranking:coalesced_total"
+COMPATIBILITY_REFRESH_SCHEDULED_KEY = "rankings:compatibility_refresh:{user_id}"
+
+
+def _incr_counter(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def record_coalesced_signal():
+    """Contabiliza um signal que foi absorvido por uma tarefa já agendada."""
+    _incr_counter(GLOBAL_RANKING_COALESCED_TOTAL_KEY)
+    return _incr_counter(GLOBAL_RANKING_COALESCED_KEY)
+
+
+def release_global_ranking_schedule():
+    """
+    Libera a trava de agendamento para que escritas feitas durante a execução
+    agendem um novo ciclo. Retorna quantos signals foram agrupados no ciclo.
+    """
+    coalesced = cache.get(GLOBAL_RANKING_COALESCED_KEY, 0)
+    cache.delete_many([GLOBAL_RANKING_SCHEDULED_KEY, GLOBAL_RANKING_COALESCED_KEY])
+    return coalesced
+
+
+def get_global_ranking_schedule_metrics():
+    return {
+        "scheduled": bool(cache.get(GLOBAL_RANKING_SCHEDULED_KEY)),
+        "coalesced_pending": cache.get(GLOBAL_RANKING_COALESCED_KEY, 0),
+        "coalesced_total": cache.get(GLOBAL_RANKING_COALESCED_TOTAL_KEY, 0),
+    }
+
+
+def _country_shards(countries, shard_size):
+    shard_size = max(1, int(shard_size or 1))
+    shards = []
+    for start in range(0, len(countries), shard_size):
+        end = start + shard_size
+        shards.append(countries[start:end])
+    return shards
 
 
 @app.task
-def run_global_ranking_calculation():
+def run_global_ranking_calculation(fan_out=None):
     """
     Tarefa agendada para calcular e atualizar o ranking global de países.
+    Com fan_out (padrão: GLOBAL_RANKING_FAN_OUT), dispara um chord com uma
+    subtarefa por shard de países e finalize_global_ranking_fan_out como callback.
+    """
+    if fan_out is None:
+        fan_out = getattr(settings, "GLOBAL_RANKING_FAN_OUT", False)
+
+    if not fan_out:
+        calculate_global_ranking()
+        return "Cálculo global de ranking concluído com sucesso."
+
+    countries = [
+        info.get("country") or info.get("user__country")
+        for info in get_eligible_countries()
+    ]
+    countries = [country for country in countries if country]
+    if not countries:
+        return "Nenhum país elegível para o cálculo global de ranking."
+
+    shards = _country_shards(
+        countries, getattr(settings, "GLOBAL_RANKING_FAN_OUT_SHARD_SIZE", 1)
+    )
+    run = GlobalRankingRun.objects.create()
+    chord(recalculate_country_rankings.s(shard, run.id) for shard in shards)(
+        finalize_global_ranking_fan_out.s(time.time())
+    )
+    logger.info(
+        "Cálculo global distribuído: %s país(es) em %s subtarefa(s).",
+        len(countries),
+        len(shards),
+    )
+    return f"Cálculo global distribuído em {len(shards)} subtarefa(s)."
+
+
+@app.task
+def recalculate_country_rankings(countries, run_id=None):
+    """
+    Subtarefa do fan-out: recalcula um shard de países, gravando os snapshots
+    na execução run_id. Falhas são capturadas e reportadas no resultado para
+    que o callback do chord sempre execute.
+    """
+    started = time.monotonic()
+    try:
+        calculate_global_ranking(countries=countries, run_id=run_id)
+        status, error = "ok", None
+    except Exception as exc:
+        logger.exception("Falha no recálculo do ranking global para %s", countries)
+        status, error = "failed", str(exc)
+
+    return {
+        "countries": countries,
+        "status": status,
+        "error": error,
+        "duration": round(time.monotonic() - started, 3),
+    }
+
+
+@app.task
+def finalize_global_ranking_fan_out(results, started_at):
+    """Callback do chord: registra conclusão, tempos e falhas do fan-out."""
+    failed = [result for result in results if result["status"] != "ok"]
+    summary = {
+        "shards": len(results),
+        "countries": sum(len(result["countries"]) for result in results),
+        "failed_countries": [
+            country for result in failed for country in result["countries"]
+        ],
+        "elapsed": round(time.time() - started_at, 3),
+        "slowest_shard": max((result["duration"] for result in results), default=0.0),
+    }
+
+    if failed:
+        logger.error("Cálculo global distribuído concluído com falhas: %s", summary)
+    else:
+        logger.info("Cálculo global distribuído concluído: %s", summary)
+    return summary
+
+
+@app.task
+def run_incremental_global_ranking_calculation():
+    """
+    Recalcula apenas os países marcados como pendentes por escritas de ranking.
     """
-    calculate_global_ranking()
-    return "Cálculo global de ranking concluído com sucesso."
+    coalesced = release_global_ranking_schedule()
+    logger.info(
+        "Recálculo incremental iniciado; %s signal(s) agrupado(s) neste ciclo.",
+        coalesced,
+    )
+    countries = calculate_dirty_country_rankings()
+    return f"Recálculo incremental concluído para {len(countries)} país(es)."
+
+
+@app.task
+def prune_global_ranking_snapshots():
+    """Aplica a retenção/redução de resolução do histórico de snapshots."""
+    removed = prune_ranking_snapshots()
+    return f"{removed} snapshot(s) de ranking global removido(s)."
+
+
+@app.task
+def precompute_album_compatibility_scores():
+    """
+    Tarefa noturna: grava a compatibilidade de álbuns de todos os pares de
+    amigos e membros de um mesmo grupo em AlbumCompatibilityScore.
+    """
+    total = precompute_compatibility_scores()
+    return f"Compatibilidade pré-calculada para {total} par(es)."
+
+
+@app.task
+def refresh_album_compatibility_scores(user_id):
+    """Recalcula os pares pré-calculados de um usuário que alterou seu ranking."""
+    cache.delete(COMPATIBILITY_REFRESH_SCHEDULED_KEY.format(user_id=user_id))
+    total = refresh_user_compatibility_scores(user_id)
+    return f"Compatibilidade atualizada para {total} par(es) do usuário {user_id}."
+
+
+def enqueue_compatibility_refresh(user_id):
+    """
+    Agenda refresh_album_compatibility_scores com atraso de
+    COMPATIBILITY_REFRESH_DEBOUNCE_SECONDS; submissões seguidas do mesmo
+    usuário dentro da janela são absorvidas pela tarefa já agendada.
+    Retorna True se uma nova tarefa foi enfileirada.
+    """
+    window = getattr(settings, "COMPATIBILITY_REFRESH_DEBOUNCE_SECONDS", 30)
+    key = COMPATIBILITY_REFRESH_SCHEDULED_KEY.format(user_id=user_id)
+    if not cache.add(key, True, timeout=window + 300):
+        return False
+
+    try:
+        refresh_album_compatibility_scores.apply_async((user_id,), countdown=window)
+        return True
+    except Exception:
+        cache.delete(key)
+        logger.exception(
+            "Falha ao enfileirar refresh_album_compatibility_scores para user_id=%s",
+            user_id,
+        )
+        return False
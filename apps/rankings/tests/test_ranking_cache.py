@@ -0,0 +1,108 @@
+import pytest
+from apps.albums.models import Album
+from apps.tracks.models import Track
+from apps.rankings.models import AlbumRanking, TrackRanking
+from apps.rankings.cache import get_album_vectors, get_track_vectors
+from apps.rankings.serializers import AlbumRankingSerializer, TrackRankingSerializer
+from apps.rankings.tasks import refresh_album_compatibility_scores
+
+
+@pytest.fixture
+def albums(db):
+    return [
+        Album.objects.create(title=f"Album {i}", release_date=f"20{10 + i}-01-01")
+        for i in range(3)
+    ]
+
+
+@pytest.mark.django_db
+class TestAlbumVectorCache:
+
+    def test_vectors_follow_release_order(self, create_user, albums):
+        user = create_user(username="vec", password="x")
+        AlbumRanking.objects.create(user=user, album=albums[2], position=1)
+        AlbumRanking.objects.create(user=user, album=albums[0], position=3)
+        AlbumRanking.objects.create(user=user, album=albums[1], position=2)
+
+        vector = get_album_vectors([user.id])[user.id]
+
+        assert list(vector.item_ids) == [a.id for a in albums]
+        assert list(vector.positions) == [3, 2, 1]
+
+    def test_second_read_is_served_from_cache(
+        self, create_user, albums, django_assert_num_queries
+    ):
+        user_a = create_user(username="a", password="x")
+        user_b = create_user(username="b", password="x")
+        AlbumRanking.objects.create(user=user_a, album=albums[0], position=1)
+
+        with django_assert_num_queries(1):
+            get_album_vectors([user_a.id, user_b.id])
+
+        with django_assert_num_queries(0):
+            vectors = get_album_vectors([user_a.id, user_b.id])
+
+        assert list(vectors[user_a.id].item_ids) == [albums[0].id]
+        assert len(vectors[user_b.id].item_ids) == 0
+
+    def test_serializer_invalidates_after_commit(
+        self, create_user, albums, monkeypatch, django_capture_on_commit_callbacks
+    ):
+        monkeypatch.setattr(
+            refresh_album_compatibility_scores, "apply_async", lambda *a, **kw: None
+        )
+        user = create_user(username="inv", password="x")
+        AlbumRanking.objects.create(user=user, album=albums[0], position=1)
+        assert list(get_album_vectors([user.id])[user.id].item_ids) == [albums[0].id]
+
+        serializer = AlbumRankingSerializer(
+            data={"rankings": [{"album_id": albums[1].id, "position": 1}]}
+        )
+        assert serializer.is_valid(), serializer.errors
+
+        with django_capture_on_commit_callbacks(execute=True):
+            serializer.create(serializer.validated_data, user=user)
+
+        assert list(get_album_vectors([user.id])[user.id].item_ids) == [albums[1].id]
+
+
+@pytest.mark.django_db
+class TestTrackVectorCache:
+
+    def test_serializer_invalidates_only_that_album(
+        self,
+        create_user,
+        albums,
+        django_capture_on_commit_callbacks,
+        django_assert_num_queries,
+    ):
+        user = create_user(username="tracks", password="x")
+        t1 = Track.objects.create(album=albums[0], title="T1", track_number=1)
+        t2 = Track.objects.create(album=albums[0], title="T2", track_number=2)
+        other = Track.objects.create(album=albums[1], title="O1", track_number=1)
+        TrackRanking.objects.create(user=user, track=t1, position=1)
+        TrackRanking.objects.create(user=user, track=t2, position=2)
+        TrackRanking.objects.create(user=user, track=other, position=1)
+
+        get_track_vectors([user.id], albums[0].id)
+        get_track_vectors([user.id], albums[1].id)
+
+        serializer = TrackRankingSerializer(
+            data={
+                "album_id": albums[0].id,
+                "rankings": [
+                    {"track_id": t1.id, "position": 2},
+                    {"track_id": t2.id, "position": 1},
+                ],
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+
+        with django_capture_on_commit_callbacks(execute=True):
+            serializer.create(serializer.validated_data, user=user)
+
+        vector = get_track_vectors([user.id], albums[0].id)[user.id]
+        assert list(vector.positions) == [2, 1]
+
+        with django_assert_num_queries(0):
+            get_track_vectors([user.id], albums[1].id)
@@ -1,4 +1,6 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIRequestFactory
 from apps.rankings.models import (
@@ -84,6 +86,31 @@ class TestAlbumRankingSerializer:
 
         assert "As posições no ranking devem ser únicas." in excinfo.value.detail[0]
 
+    def test_album_ranking_invalid_submission_keeps_previous_ranking(
+        self, user_fixture, album_fixture
+    ):
+        """Testa se a validação acontece antes de qualquer escrita."""
+        AlbumRanking.objects.create(user=user_fixture, album=album_fixture, position=1)
+        album2 = Album.objects.create(title="Reputation", release_date="2017-11-10")
+
+        serializer = AlbumRankingSerializer(
+            data={
+                "rankings": [
+                    {"album_id": album_fixture.id, "position": 2},
+                    {"album_id": album2.id, "position": 2},
+                ]
+            }
+        )
+        assert serializer.is_valid()
+        with pytest.raises(ValidationError):
+            serializer.create(serializer.validated_data, user=user_fixture)
+
+        assert list(
+            AlbumRanking.objects.filter(user=user_fixture).values_list(
+                "album_id", "position"
+            )
+        ) == [(album_fixture.id, 1)]
+
     def test_album_ranking_clears_previous_rankings(
         self, user_fixture, album_fixture, api_request
     ):
@@ -108,6 +135,78 @@ class TestAlbumRankingSerializer:
         assert AlbumRanking.objects.filter(user=user_fixture).count() == 1
         assert AlbumRanking.objects.get(user=user_fixture).album == album2
 
+    def _validated(self, pairs):
+        serializer = AlbumRankingSerializer(
+            data={
+                "rankings": [
+                    {"album_id": album.id, "position": position}
+                    for album, position in pairs
+                ]
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+        return serializer
+
+    def _submit(self, user, pairs):
+        serializer = self._validated(pairs)
+        return serializer.create(serializer.validated_data, user=user)
+
+    def _write_statements(self, user, pairs):
+        serializer = self._validated(pairs)
+        with CaptureQueriesContext(connection) as ctx:
+            serializer.create(serializer.validated_data, user=user)
+        statements = [
+            q["sql"].lstrip().split()[0].upper()
+            for q in ctx.captured_queries
+            if '"rankings_albumranking"' in q["sql"]
+        ]
+        return [sql for sql in statements if sql in ("INSERT", "UPDATE", "DELETE")]
+
+    def _albums(self, count):
+        return [
+            Album.objects.create(title=f"Diff {i}", release_date=f"201{i}-01-01")
+            for i in range(count)
+        ]
+
+    def test_album_ranking_reorder_only_updates_positions(self, user_fixture):
+        """Testa se uma troca de posições vira UPDATEs, sem apagar/recriar linhas."""
+        a, b, c = self._albums(3)
+        self._submit(user_fixture, [(a, 1), (b, 2), (c, 3)])
+        ids_before = dict(
+            AlbumRanking.objects.filter(user=user_fixture).values_list("album_id", "id")
+        )
+
+        writes = self._write_statements(user_fixture, [(a, 2), (b, 1), (c, 3)])
+
+        assert writes == ["UPDATE", "UPDATE"]
+        rankings = AlbumRanking.objects.filter(user=user_fixture)
+        assert dict(rankings.values_list("album_id", "id")) == ids_before
+        assert dict(rankings.values_list("album_id", "position")) == {
+            a.id: 2,
+            b.id: 1,
+            c.id: 3,
+        }
+
+    def test_album_ranking_diff_applies_inserts_updates_and_deletes(self, user_fixture):
+        """Testa remoção, reposicionamento e inserção na mesma submissão."""
+        a, b, c, d = self._albums(4)
+        self._submit(user_fixture, [(a, 1), (b, 2), (c, 3)])
+
+        result = self._submit(user_fixture, [(d, 1), (c, 2), (a, 3)])
+
+        assert [r.album_id for r in result] == [d.id, c.id, a.id]
+        assert dict(
+            AlbumRanking.objects.filter(user=user_fixture).values_list(
+                "album_id", "position"
+            )
+        ) == {d.id: 1, c.id: 2, a.id: 3}
+
+    def test_album_ranking_unchanged_submission_writes_nothing(self, user_fixture):
+        a, b = self._albums(2)
+        self._submit(user_fixture, [(a, 1), (b, 2)])
+
+        assert self._write_statements(user_fixture, [(a, 1), (b, 2)]) == []
+
 
 @pytest.mark.django_db
 class TestTrackRankingSerializer:
@@ -137,6 +236,49 @@ class TestTrackRankingSerializer:
         assert TrackRanking.objects.filter(user=user_fixture).count() == 2
         assert TrackRanking.objects.get(user=user_fixture, track=track2).position == 1
 
+    def test_track_ranking_resolves_tracks_in_one_query(
+        self, album_fixture, django_assert_num_queries
+    ):
+        """Testa se todas as músicas enviadas são buscadas com uma única query."""
+        tracks = [
+            Track.objects.create(album=album_fixture, title=f"F{n}", track_number=n)
+            for n in range(1, 13)
+        ]
+        data = {
+            "album_id": album_fixture.id,
+            "rankings": [
+                {"track_id": track.id, "position": position}
+                for position, track in enumerate(tracks, start=1)
+            ],
+        }
+
+        serializer = TrackRankingSerializer(data=data)
+        with django_assert_num_queries(2):
+            assert serializer.is_valid(), serializer.errors
+
+        assert [item["track"] for item in serializer.validated_data["rankings"]] == (
+            tracks
+        )
+
+    def test_track_ranking_reports_missing_track_by_position(
+        self, album_fixture, track_fixture
+    ):
+        """Testa se ids inexistentes geram erro apenas no item correspondente."""
+        data = {
+            "album_id": album_fixture.id,
+            "rankings": [
+                {"track_id": track_fixture.id, "position": 1},
+                {"track_id": 999999, "position": 2},
+            ],
+        }
+
+        serializer = TrackRankingSerializer(data=data)
+
+        assert not serializer.is_valid()
+        errors = serializer.errors["rankings"]
+        assert errors[0] == {}
+        assert "999999" in str(errors[1]["track_id"][0])
+
     def test_track_ranking_invalid_track_album_mismatch(
         self, user_fixture, album_fixture, track_fixture, api_request
     ):
@@ -198,6 +340,32 @@ class TestTrackRankingSerializer:
         assert not TrackRanking.objects.filter(track=track_fixture).exists()
         assert TrackRanking.objects.filter(track=track_outro).exists()
 
+    def test_track_ranking_failure_keeps_previous_ranking(
+        self, user_fixture, album_fixture, track_fixture, monkeypatch
+    ):
+        """Testa se uma falha na gravação não deixa o usuário sem ranking."""
+        TrackRanking.objects.create(user=user_fixture, track=track_fixture, position=1)
+
+        def broken(*args, **kwargs):
+            raise RuntimeError("falha no insert")
+
+        monkeypatch.setattr(TrackRanking.objects, "bulk_create", broken)
+
+        serializer = TrackRankingSerializer(
+            data={
+                "album_id": album_fixture.id,
+                "rankings": [{"track_id": track_fixture.id, "position": 2}],
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+        with pytest.raises(RuntimeError):
+            serializer.create(serializer.validated_data, user=user_fixture)
+
+        assert (
+            TrackRanking.objects.get(user=user_fixture, track=track_fixture).position
+            == 1
+        )
+
 
 @pytest.mark.django_db
 class TestUserRankingCreateSerializer:
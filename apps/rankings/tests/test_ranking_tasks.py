@@ -0,0 +1,310 @@
+import pytest
+from config.celery import app
+from apps.albums.models import Album
+from apps.users.models import User
+from apps.rankings import signals, tasks, utils
+from apps.rankings.models import (
+    AlbumCompatibilityScore,
+    AlbumRanking,
+    CountryGlobalRanking,
+    GlobalRankingRun,
+)
+from apps.rankings.serializers import AlbumRankingSerializer
+from apps.rankings.tasks import (
+    _country_shards,
+    finalize_global_ranking_fan_out,
+    get_global_ranking_schedule_metrics,
+    precompute_album_compatibility_scores,
+    recalculate_country_rankings,
+    refresh_album_compatibility_scores,
+    release_global_ranking_schedule,
+    run_global_ranking_calculation,
+    run_incremental_global_ranking_calculation,
+)
+from apps.rankings.utils import (
+    calculate_album_compatibility,
+    get_compatibility_pairs,
+    mark_compatibility_scores_stale,
+)
+from apps.social.models import Friendship, Group
+
+
+@pytest.fixture
+def apply_async_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        run_incremental_global_ranking_calculation,
+        "apply_async",
+        lambda *args, **kwargs: calls.append(kwargs),
+    )
+    return calls
+
+
+class TestGlobalRankingScheduling:
+
+    def test_signals_within_window_are_coalesced(self, apply_async_calls, settings):
+        settings.GLOBAL_RANKING_DEBOUNCE_SECONDS = 15
+
+        results = [signals.enqueue_global_ranking_task() for _ in range(5)]
+
+        assert results == [True, False, False, False, False]
+        assert apply_async_calls == [{"countdown": 15}]
+        metrics = get_global_ranking_schedule_metrics()
+        assert metrics["scheduled"] is True
+        assert metrics["coalesced_pending"] == 4
+        assert metrics["coalesced_total"] == 4
+
+    def test_release_allows_next_cycle(self, apply_async_calls):
+        signals.enqueue_global_ranking_task()
+        signals.enqueue_global_ranking_task()
+
+        assert release_global_ranking_schedule() == 1
+        assert signals.enqueue_global_ranking_task() is True
+        assert len(apply_async_calls) == 2
+        assert get_global_ranking_schedule_metrics()["coalesced_total"] == 1
+
+    def test_failed_enqueue_releases_lock(self, monkeypatch):
+        def broken(*args, **kwargs):
+            raise ConnectionError("broker down")
+
+        monkeypatch.setattr(
+            run_incremental_global_ranking_calculation, "apply_async", broken
+        )
+
+        assert signals.enqueue_global_ranking_task() is False
+        assert get_global_ranking_schedule_metrics()["scheduled"] is False
+
+
+@pytest.mark.django_db
+class TestRankingChangedEvent:
+
+    def test_submission_emits_one_event_and_one_enqueue(
+        self,
+        apply_async_calls,
+        settings,
+        monkeypatch,
+        django_capture_on_commit_callbacks,
+    ):
+        settings.GLOBAL_RANKING_DEBOUNCE_SECONDS = 15
+        refreshes = []
+        monkeypatch.setattr(
+            refresh_album_compatibility_scores,
+            "apply_async",
+            lambda args, **kwargs: refreshes.append(args),
+        )
+        albums = [
+            Album.objects.create(title=f"E{i}", release_date=f"201{i}-01-01")
+            for i in range(5)
+        ]
+        user = User.objects.create(username="evt", country="BR")
+        for position, album in enumerate(albums[:3], start=1):
+            AlbumRanking.objects.create(user=user, album=album, position=position)
+        events = []
+
+        def listener(sender, **kwargs):
+            events.append(
+                (sender, kwargs["user_id"], kwargs["country"], kwargs["album_ids"])
+            )
+
+        signals.ranking_changed.connect(listener)
+        try:
+            serializer = AlbumRankingSerializer(
+                data={
+                    "rankings": [
+                        {"album_id": albums[2].id, "position": 1},
+                        {"album_id": albums[1].id, "position": 2},
+                        {"album_id": albums[3].id, "position": 3},
+                        {"album_id": albums[4].id, "position": 4},
+                    ]
+                }
+            )
+            assert serializer.is_valid(), serializer.errors
+            with django_capture_on_commit_callbacks(execute=True):
+                serializer.create(serializer.validated_data, user=user)
+        finally:
+            signals.ranking_changed.disconnect(listener)
+
+        assert len(events) == 1
+        sender, user_id, country, album_ids = events[0]
+        assert (sender, user_id, country) == (AlbumRankingSerializer, user.id, "BR")
+        assert sorted(album_ids) == [albums[i].id for i in (0, 2, 3, 4)]
+        assert apply_async_calls == [{"countdown": 15}]
+        assert refreshes == [(user.id,)]
+
+
+@pytest.fixture
+def eager_celery(monkeypatch):
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    monkeypatch.setattr(app.conf, "task_eager_propagates", True)
+
+
+@pytest.mark.django_db
+class TestGlobalRankingFanOut:
+
+    def _seed(self, countries):
+        album = Album.objects.create(title="Fan-out", release_date="2020-01-01")
+        for country in countries:
+            for i in range(2):
+                user = User.objects.create(username=f"{country}-{i}", country=country)
+                AlbumRanking.objects.create(user=user, album=album, position=i + 1)
+
+    def test_shards_split_countries(self):
+        assert _country_shards(["A", "B", "C"], 2) == [["A", "B"], ["C"]]
+        assert _country_shards(["A", "B"], 0) == [["A"], ["B"]]
+
+    def test_fan_out_recalculates_every_country(self, eager_celery, monkeypatch):
+        self._seed(["BR", "US", "PT"])
+        summaries = []
+        original = finalize_global_ranking_fan_out.run
+        monkeypatch.setattr(
+            finalize_global_ranking_fan_out,
+            "run",
+            lambda *args: summaries.append(original(*args)) or summaries[-1],
+        )
+
+        run_global_ranking_calculation.apply(kwargs={"fan_out": True})
+
+        assert set(
+            CountryGlobalRanking.objects.values_list("country_name", flat=True)
+        ) == {"BR", "US", "PT"}
+        assert summaries[0]["shards"] == 3
+        assert summaries[0]["failed_countries"] == []
+        assert GlobalRankingRun.objects.count() == 1
+        assert GlobalRankingRun.objects.get().snapshots.count() == 3
+
+    def test_subtask_failure_is_reported(self, monkeypatch):
+        def broken(countries=None, run_id=None):
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(tasks, "calculate_global_ranking", broken)
+
+        result = recalculate_country_rankings.run(["BR"])
+
+        assert result["status"] == "failed"
+        assert result["error"] == "boom"
+        summary = finalize_global_ranking_fan_out.run([result], 0)
+        assert summary["failed_countries"] == ["BR"]
+
+
+@pytest.mark.django_db
+class TestAlbumCompatibilityPrecompute:
+
+    def _seed(self):
+        albums = [
+            Album.objects.create(title=f"P{i}", release_date=f"201{i}-01-01")
+            for i in range(3)
+        ]
+        users = []
+        for name, positions in (
+            ("ana", (1, 2, 3)),
+            ("bia", (3, 2, 1)),
+            ("caio", (1, 3, 2)),
+            ("duda", (2, 1, 3)),
+        ):
+            user = User.objects.create(username=name)
+            for album, position in zip(albums, positions):
+                AlbumRanking.objects.create(user=user, album=album, position=position)
+            users.append(user)
+        ana, bia, caio, duda = users
+        Friendship.objects.create(from_user=bia, to_user=ana, status="accepted")
+        Friendship.objects.create(from_user=ana, to_user=duda, status="pending")
+        group = Group.objects.create(name="Trio", owner=ana)
+        for member in (ana, caio, duda):
+            group.members.add(member)
+        return albums, users
+
+    def _pairs(self):
+        return {
+            (score.user_low_id, score.user_high_id): score
+            for score in AlbumCompatibilityScore.objects.all()
+        }
+
+    def test_nightly_job_stores_friend_and_co_member_pairs(self):
+        _, (ana, bia, caio, duda) = self._seed()
+
+        precompute_album_compatibility_scores.apply()
+
+        pairs = self._pairs()
+        assert set(pairs) == {
+            (ana.id, bia.id),
+            (ana.id, caio.id),
+            (ana.id, duda.id),
+            (caio.id, duda.id),
+        }
+        percent, shared, report = calculate_album_compatibility(ana, bia)
+        assert pairs[(ana.id, bia.id)].percent == percent
+        assert pairs[(ana.id, bia.id)].shared_count == shared
+        assert pairs[(ana.id, bia.id)].report == report
+
+        Friendship.objects.all().delete()
+        precompute_album_compatibility_scores.apply()
+        assert (ana.id, bia.id) not in self._pairs()
+
+    def test_mark_during_refresh_keeps_pair_stale(self, monkeypatch):
+        _, (ana, bia, caio, duda) = self._seed()
+        precompute_album_compatibility_scores.apply()
+        mark_compatibility_scores_stale(ana.id)
+        original = utils._score_rows
+
+        def score_then_concurrent_write(pairs):
+            rows = original(pairs)
+            # Outra submissão de ana confirma depois da leitura dos vetores.
+            mark_compatibility_scores_stale(ana.id)
+            return rows
+
+        monkeypatch.setattr(utils, "_score_rows", score_then_concurrent_write)
+
+        refresh_album_compatibility_scores.run(ana.id)
+
+        pairs = self._pairs()
+        assert pairs[(ana.id, bia.id)].is_stale
+        assert pairs[(ana.id, caio.id)].is_stale
+        assert not pairs[(caio.id, duda.id)].is_stale
+
+    def test_user_pairs_only_involve_that_user(self):
+        _, (ana, bia, caio, duda) = self._seed()
+
+        assert get_compatibility_pairs([caio.id]) == {
+            (ana.id, caio.id),
+            (caio.id, duda.id),
+        }
+        assert get_compatibility_pairs([bia.id, duda.id]) == {
+            (ana.id, bia.id),
+            (ana.id, duda.id),
+            (caio.id, duda.id),
+        }
+
+    def test_ranking_change_marks_stale_and_refreshes(
+        self, monkeypatch, django_capture_on_commit_callbacks
+    ):
+        albums, (ana, bia, caio, duda) = self._seed()
+        precompute_album_compatibility_scores.apply()
+        enqueued = []
+        monkeypatch.setattr(
+            refresh_album_compatibility_scores,
+            "apply_async",
+            lambda args, **kwargs: enqueued.append(args),
+        )
+
+        serializer = AlbumRankingSerializer(
+            data={
+                "rankings": [
+                    {"album_id": album.id, "position": position}
+                    for album, position in zip(albums, (3, 2, 1))
+                ]
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+        with django_capture_on_commit_callbacks(execute=True):
+            serializer.create(serializer.validated_data, user=ana)
+
+        assert enqueued == [(ana.id,)]
+        pairs = self._pairs()
+        assert pairs[(ana.id, bia.id)].is_stale
+        assert not pairs[(caio.id, duda.id)].is_stale
+
+        refresh_album_compatibility_scores.run(ana.id)
+
+        refreshed = self._pairs()[(ana.id, bia.id)]
+        assert not refreshed.is_stale
+        assert refreshed.percent == 100.0
@@ -1,14 +1,32 @@
+import statistics
+
 import pytest
 from django.utils import timezone
-from django.db import models
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
 from apps.users.models import User
 from apps.albums.models import Album
 from apps.rankings.models import (
     AlbumRanking,
+    CountryGlobalRanking,
+    CountryRankingSnapshot,
+    DirtyCountry,
+    GlobalRankingRun,
     GroupRanking,
+    TrackRanking,
 )
+from apps.rankings.serializers import AlbumRankingSerializer
 from apps.rankings.utils import (
     calculate_album_compatibility,
+    calculate_dirty_country_rankings,
+    clear_dirty_countries,
+    calculate_global_ranking,
+    get_country_album_stats,
+    get_ranking_history,
+    get_dirty_countries,
+    prune_ranking_snapshots,
+    stream_country_track_stats,
+    calculate_group_album_matrix,
     calculate_group_internal_coherence,
 )
 from apps.tracks.models import Track
@@ -160,6 +178,74 @@ class TestAlbumCompatibility:
         assert report["max_position_difference"] == 3
         assert report["min_position_difference"] == 0
 
+    def test_query_count_is_constant(self, django_assert_num_queries):
+        user_a = User.objects.create(username="a")
+        user_b = User.objects.create(username="b")
+
+        for i in range(1, 9):
+            album = self._make_album(f"Q{i}")
+            AlbumRanking.objects.create(user=user_a, album=album, position=i)
+            AlbumRanking.objects.create(user=user_b, album=album, position=9 - i)
+
+        with django_assert_num_queries(1):
+            percent, shared, report = calculate_album_compatibility(user_a, user_b)
+
+        assert shared == 8
+        assert report["max_position_difference"] == 7
+
+
+@pytest.mark.django_db
+class TestGroupAlbumMatrix:
+
+    def _make_album(self, label, year):
+        return Album.objects.create(
+            title=f"{label}-title", release_date=f"{year}-01-01"
+        )
+
+    def test_pairs_match_duo_calculation(self, django_assert_num_queries):
+        users = [User.objects.create(username=f"m{i}") for i in range(4)]
+        albums = [self._make_album(f"M{i}", 2010 + i) for i in range(4)]
+
+        positions = [
+            [1, 2, 3, 4],
+            [4, 3, 2, 1],
+            [1, 3, 2, None],
+            [2, 1, None, 3],
+        ]
+        for user, row in zip(users, positions):
+            for album, position in zip(albums, row):
+                if position is not None:
+                    AlbumRanking.objects.create(
+                        user=user, album=album, position=position
+                    )
+
+        with django_assert_num_queries(2):
+            matrix = calculate_group_album_matrix([u.id for u in users])
+
+        assert len(matrix["pairs"]) == 6
+        for pair in matrix["pairs"]:
+            user_a = User.objects.get(id=pair["user_a_id"])
+            user_b = User.objects.get(id=pair["user_b_id"])
+            percent, shared, report = calculate_album_compatibility(user_a, user_b)
+            assert pair["percent"] == percent
+            assert pair["shared"] == shared
+            assert pair["report"] == report
+
+        percents = [pair["percent"] for pair in matrix["pairs"]]
+        assert matrix["best_pair"]["percent"] == max(percents)
+        assert matrix["worst_pair"]["percent"] == min(percents)
+        assert matrix["average_percent"] == round(sum(percents) / len(percents), 2)
+
+    def test_item_stats_count_each_member_once(self):
+        users = [User.objects.create(username=f"s{i}") for i in range(3)]
+        album = self._make_album("Stats", 2020)
+        for user, position in zip(users, (1, 2, 3)):
+            AlbumRanking.objects.create(user=user, album=album, position=position)
+
+        matrix = calculate_group_album_matrix([u.id for u in users])
+
+        assert matrix["item_stats"][album.id] == {"avg_position": 2, "std_dev": 1.0}
+
 
 @pytest.mark.django_db
 class TestGlobalRanking:
@@ -183,6 +269,211 @@ class TestGlobalRanking:
             title=f"{label}-title", album=album, track_number=track_number
         )
 
+    def _seed_countries(self):
+        a1 = self._make_album("G1")
+        a2 = self._make_album("G2")
+        users = {}
+        for country in ("BR", "US"):
+            for i in range(2):
+                user = User.objects.create(username=f"{country}-{i}", country=country)
+                AlbumRanking.objects.create(user=user, album=a1, position=i + 1)
+                AlbumRanking.objects.create(user=user, album=a2, position=2 - i)
+                users.setdefault(country, []).append(user)
+        return a1, a2, users
+
+    def test_full_run_builds_every_country(self):
+        a1, a2, _ = self._seed_countries()
+
+        calculate_global_ranking()
+
+        rankings = {r.country_name: r for r in CountryGlobalRanking.objects.all()}
+        assert set(rankings) == {"BR", "US"}
+        br = rankings["BR"]
+        assert br.user_count == 2
+        assert br.analysis_data[str(a1.id)]["avg_rank"] == 1.5
+        assert br.analysis_data[str(a1.id)]["votes"] == 2
+
+    def test_rerun_upserts_all_countries_in_one_statement(self):
+        a1, _, users = self._seed_countries()
+        calculate_global_ranking()
+        AlbumRanking.objects.filter(user=users["BR"][0], album=a1).update(position=3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            calculate_global_ranking()
+
+        writes = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if "rankings_countryglobalranking" in q["sql"]
+            and not q["sql"].lstrip().upper().startswith("SELECT")
+        ]
+        assert len(writes) == 1
+        assert CountryGlobalRanking.objects.count() == 2
+        br = CountryGlobalRanking.objects.get(country_name="BR")
+        assert br.analysis_data[str(a1.id)]["avg_rank"] == 2.5
+        assert "track_analysis_by_album" in br.analysis_data
+
+    def test_country_album_stats_use_one_query(self, django_assert_num_queries):
+        a1, a2, users = self._seed_countries()
+        extra = User.objects.create(username="BR-2", country="BR")
+        AlbumRanking.objects.create(user=extra, album=a1, position=5)
+
+        with django_assert_num_queries(1):
+            stats = get_country_album_stats(["BR", "US"])
+
+        br_a1 = next(row for row in stats["BR"] if row["album_id"] == a1.id)
+        assert br_a1["count"] == 3
+        assert br_a1["avg_position"] == pytest.approx(statistics.mean([1, 2, 5]))
+        assert br_a1["std_dev"] == pytest.approx(statistics.stdev([1, 2, 5]))
+        assert [row["avg_position"] for row in stats["US"]] == [1.5, 1.5]
+
+    def test_track_analysis_from_streamed_stats(self):
+        a1, _, users = self._seed_countries()
+        t1 = self._make_track(a1, "T1")
+        t2 = self._make_track(a1, "T2")
+        for user, (p1, p2) in zip(users["BR"], ((1, 2), (3, 1))):
+            TrackRanking.objects.create(user=user, track=t1, position=p1)
+            TrackRanking.objects.create(user=user, track=t2, position=p2)
+
+        assert stream_country_track_stats(["BR", "US"]) == {
+            "BR": {t1.id: [2, 4, 10], t2.id: [2, 3, 5]}
+        }
+
+        calculate_global_ranking()
+
+        br = CountryGlobalRanking.objects.get(country_name="BR")
+        album_tracks = br.analysis_data["track_analysis_by_album"][str(a1.id)]
+        assert album_tracks["top_track_id"] == t2.id
+        assert album_tracks["tracks"][str(t1.id)] == {
+            "track_title": "T1-title",
+            "album_id": a1.id,
+            "avg_rank": 2.0,
+            "std_dev_rank": 1.41,
+            "votes": 2,
+        }
+        assert br.global_consensus_track_id == t2.id
+        assert br.consensus_album_id is not None
+
+    def _submit(self, user, positions):
+        serializer = AlbumRankingSerializer(
+            data={
+                "rankings": [
+                    {"album_id": album.id, "position": position}
+                    for album, position in positions
+                ]
+            }
+        )
+        assert serializer.is_valid(), serializer.errors
+        serializer.create(serializer.validated_data, user=user)
+
+    def test_ranking_submissions_mark_country_dirty(self):
+        a1, a2, users = self._seed_countries()
+
+        # Escritas diretas no ORM não disparam mais o evento por linha.
+        assert not DirtyCountry.objects.exists()
+
+        self._submit(users["US"][0], [(a1, 2), (a2, 1)])
+        self._submit(users["BR"][0], [(a1, 2), (a2, 1)])
+
+        marks = get_dirty_countries()
+        assert sorted(country for country, _ in marks) == ["BR", "US"]
+        clear_dirty_countries(marks)
+
+        # Reenviar o mesmo ranking não altera nada e não dispara o evento.
+        self._submit(users["US"][0], [(a1, 2), (a2, 1)])
+        assert not DirtyCountry.objects.exists()
+
+    def test_incremental_run_only_rebuilds_dirty_countries(self):
+        a1, a2, users = self._seed_countries()
+        calculate_global_ranking()
+        DirtyCountry.objects.all().delete()
+        br_updated_at = CountryGlobalRanking.objects.get(country_name="BR").updated_at
+
+        self._submit(users["US"][0], [(a1, 2), (a2, 1)])
+
+        assert calculate_dirty_country_rankings() == ["US"]
+
+        br = CountryGlobalRanking.objects.get(country_name="BR")
+        us = CountryGlobalRanking.objects.get(country_name="US")
+        assert br.updated_at == br_updated_at
+        assert us.analysis_data[str(a1.id)]["avg_rank"] == 2.0
+        assert not DirtyCountry.objects.exists()
+
+    def test_clear_keeps_marks_rewritten_after_read(self):
+        a1, a2, users = self._seed_countries()
+        self._submit(users["US"][0], [(a1, 2), (a2, 1)])
+        self._submit(users["BR"][0], [(a1, 2), (a2, 1)])
+        marks = get_dirty_countries()
+
+        # Escrita que confirmou depois da leitura, com marked_at anterior.
+        earlier = min(marked_at for _, marked_at in marks) - timezone.timedelta(
+            seconds=1
+        )
+        DirtyCountry.objects.filter(country_name="US").update(marked_at=earlier)
+        clear_dirty_countries(marks)
+
+        assert list(DirtyCountry.objects.values_list("country_name", flat=True)) == [
+            "US"
+        ]
+
+    def test_failed_incremental_run_keeps_dirty_marks(self, monkeypatch):
+        a1, a2, users = self._seed_countries()
+        calculate_global_ranking()
+        self._submit(users["US"][0], [(a1, 2), (a2, 1)])
+
+        def broken(*args, **kwargs):
+            raise RuntimeError("falha no cálculo")
+
+        monkeypatch.setattr("apps.rankings.utils.stream_country_track_stats", broken)
+        with pytest.raises(RuntimeError):
+            calculate_dirty_country_rankings()
+
+        assert list(DirtyCountry.objects.values_list("country_name", flat=True)) == [
+            "US"
+        ]
+
+    def test_each_run_appends_a_packed_snapshot(self):
+        a1, a2, users = self._seed_countries()
+        calculate_global_ranking()
+        AlbumRanking.objects.filter(user=users["BR"][0], album=a1).update(position=3)
+        calculate_global_ranking()
+
+        assert GlobalRankingRun.objects.count() == 2
+        assert CountryRankingSnapshot.objects.count() == 4
+
+        series = get_ranking_history(country="BR", album_id=a1.id)
+        assert [point["avg_rank"] for point in series] == [1.5, 2.5]
+        assert [point["votes"] for point in series] == [2, 2]
+
+        full = get_ranking_history(country="US")
+        assert [row["album_id"] for row in full[0]["albums"]] == sorted([a1.id, a2.id])
+
+    def test_prune_downsamples_and_expires_old_runs(self, settings):
+        settings.GLOBAL_RANKING_SNAPSHOT_FULL_RESOLUTION_DAYS = 7
+        settings.GLOBAL_RANKING_SNAPSHOT_RETENTION_DAYS = 30
+        self._seed_countries()
+        now = timezone.localtime().replace(hour=12)
+        ages = [
+            timezone.timedelta(days=1),
+            timezone.timedelta(days=10, hours=1),
+            timezone.timedelta(days=10),
+            timezone.timedelta(days=60),
+        ]
+        runs = []
+        for age in ages:
+            run = GlobalRankingRun.objects.create(created_at=now - age)
+            calculate_global_ranking(run_id=run.id)
+            runs.append(run)
+
+        removed = prune_ranking_snapshots(now=now)
+
+        assert removed == 4
+        assert set(GlobalRankingRun.objects.values_list("id", flat=True)) == {
+            runs[0].id,
+            runs[2].id,
+        }
+        assert CountryRankingSnapshot.objects.count() == 4
+
 
 class TestGroupInternalCoherence(TestCase):
     def _make_user(self, username, country="BR"):
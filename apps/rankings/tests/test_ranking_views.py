@@ -0,0 +1,736 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.albums.models import Album
+from apps.tracks.models import Track
+from apps.rankings.models import (
+    AlbumCompatibilityScore,
+    AlbumRanking,
+    CountryAlbumStat,
+    CountryGlobalRanking,
+    TrackRanking,
+)
+from apps.rankings.utils import calculate_global_ranking, find_best_matches
+from apps.social.models import Friendship, Group
+
+
+@pytest.fixture
+def albums(db):
+    return [
+        Album.objects.create(title=f"Album {i}", release_date=f"20{10 + i}-01-01")
+        for i in range(5)
+    ]
+
+
+def _make_ranked_group(create_user, albums, size, prefix):
+    members = [
+        create_user(username=f"{prefix}{i}", email=f"{prefix}{i}@test.com")
+        for i in range(size)
+    ]
+    group = Group.objects.create(name=f"Grupo {prefix}", owner=members[0])
+    for offset, member in enumerate(members):
+        group.members.add(member)
+        for idx, album in enumerate(albums):
+            AlbumRanking.objects.create(
+                user=member,
+                album=album,
+                position=(idx + offset) % len(albums) + 1,
+            )
+    return group, members
+
+
+def _seed_country(create_user, albums, country="Brasil"):
+    for i in range(2):
+        user = create_user(
+            username=f"{country}{i}", email=f"{country}{i}@t.com", country=country
+        )
+        AlbumRanking.objects.create(user=user, album=albums[0], position=i + 1)
+        AlbumRanking.objects.create(user=user, album=albums[1], position=2 - i)
+
+
+@pytest.mark.django_db
+class TestRankingImportView:
+
+    def _catalog(self, albums):
+        return {
+            album.id: [
+                Track.objects.create(album=album, title=f"T{n}", track_number=n)
+                for n in (1, 2, 3)
+            ]
+            for album in albums[:3]
+        }
+
+    def _payload(self, albums, catalog):
+        return {
+            "albums": [
+                {"album_id": album.id, "position": position}
+                for position, album in enumerate(albums, start=1)
+            ],
+            "tracks": [
+                {
+                    "album_id": album_id,
+                    "rankings": [
+                        {"track_id": track.id, "position": 3 - n}
+                        for n, track in enumerate(tracks)
+                    ],
+                }
+                for album_id, tracks in catalog.items()
+            ],
+        }
+
+    def test_imports_everything_in_one_transaction(
+        self, api_client, create_user, albums, monkeypatch
+    ):
+        user = create_user(username="migra", email="migra@test.com", country="BR")
+        catalog = self._catalog(albums)
+        events = []
+        monkeypatch.setattr(
+            "apps.rankings.serializers.send_ranking_changed",
+            lambda sender, user, **kwargs: events.append(kwargs),
+        )
+        api_client.force_authenticate(user=user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.post(
+                reverse("ranking-import"),
+                self._payload(albums, catalog),
+                format="json",
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        assert response.data["albums"] == 5
+        assert response.data["tracks"] == 9
+        assert AlbumRanking.objects.filter(user=user).count() == 5
+        first_tracks = catalog[albums[0].id]
+        assert list(
+            TrackRanking.objects.filter(user=user, track__album=albums[0])
+            .order_by("position")
+            .values_list("track_id", flat=True)
+        ) == [track.id for track in reversed(first_tracks)]
+        assert len(events) == 1
+        assert sorted(events[0]["track_album_ids"]) == sorted(catalog)
+
+        catalog_queries = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if 'FROM "albums_album"' in q["sql"] or 'FROM "tracks_track"' in q["sql"]
+        ]
+        # Um in_bulk por campo: álbuns do ranking, álbuns das seções e músicas
+        # de todas as seções juntas, independente do tamanho do payload.
+        assert len(catalog_queries) == 3
+
+    def test_invalid_section_rejects_whole_import(
+        self, api_client, create_user, albums
+    ):
+        user = create_user(username="migra2", email="migra2@test.com")
+        catalog = self._catalog(albums)
+        AlbumRanking.objects.create(user=user, album=albums[0], position=1)
+        payload = self._payload(albums, catalog)
+        payload["tracks"][1]["rankings"][0]["track_id"] = catalog[albums[0].id][0].id
+        api_client.force_authenticate(user=user)
+
+        response = api_client.post(reverse("ranking-import"), payload, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "tracks" in response.data
+        assert list(
+            AlbumRanking.objects.filter(user=user).values_list("album_id", flat=True)
+        ) == [albums[0].id]
+        assert not TrackRanking.objects.filter(user=user).exists()
+
+    def test_missing_track_is_reported_at_its_position(
+        self, api_client, create_user, albums
+    ):
+        user = create_user(username="migra4", email="migra4@test.com")
+        catalog = self._catalog(albums)
+        payload = self._payload(albums, catalog)
+        payload["tracks"][1]["rankings"][2]["track_id"] = 999999
+        api_client.force_authenticate(user=user)
+
+        response = api_client.post(reverse("ranking-import"), payload, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        section_errors = response.data["tracks"][1]["rankings"]
+        assert section_errors[2] == {
+            "track_id": ['Invalid pk "999999" - object does not exist.']
+        }
+        assert response.data["tracks"][0] == {}
+        assert not AlbumRanking.objects.filter(user=user).exists()
+
+    def test_empty_payload_is_rejected(self, api_client, create_user):
+        user = create_user(username="migra3", email="migra3@test.com")
+        api_client.force_authenticate(user=user)
+
+        response = api_client.post(reverse("ranking-import"), {}, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestGroupCompatibilityView:
+
+    def _get(self, api_client, group, user):
+        api_client.force_authenticate(user=user)
+        url = reverse("group-compatibility", args=[group.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(url)
+        return response, len(ctx.captured_queries)
+
+    def test_collective_analysis_counts_each_member_once(
+        self, api_client, create_user, albums
+    ):
+        group, members = _make_ranked_group(create_user, albums, 3, "c")
+
+        response, _ = self._get(api_client, group, members[0])
+
+        assert response.status_code == status.HTTP_200_OK
+        analysis = response.data["collective_analysis"]
+        assert len(response.data["detailed_comparisons"]) == 3
+        assert analysis["full_group_ranking_data"] == {
+            albums[0].id: {"avg_position": 2.0, "std_dev": 1.0},
+            albums[1].id: {"avg_position": 3.0, "std_dev": 1.0},
+            albums[2].id: {"avg_position": 4.0, "std_dev": 1.0},
+            albums[3].id: {"avg_position": 3.33, "std_dev": 2.08},
+            albums[4].id: {"avg_position": 2.67, "std_dev": 2.08},
+        }
+        assert analysis["consensus_album_id"] == albums[0].id
+        assert analysis["discord_album_id"] == albums[2].id
+        assert analysis["polarization_album_id"] == albums[3].id
+
+    def test_query_count_is_constant_as_group_grows(
+        self, api_client, create_user, albums
+    ):
+        small_group, small_members = _make_ranked_group(create_user, albums, 3, "s")
+        large_group, large_members = _make_ranked_group(create_user, albums, 15, "l")
+
+        small_response, small_queries = self._get(
+            api_client, small_group, small_members[0]
+        )
+        large_response, large_queries = self._get(
+            api_client, large_group, large_members[0]
+        )
+
+        assert small_response.status_code == status.HTTP_200_OK
+        assert large_response.status_code == status.HTTP_200_OK
+        assert len(large_response.data["detailed_comparisons"]) == 105
+        assert large_queries == small_queries
+
+
+@pytest.mark.django_db
+class TestGroupTrackCompatibilityView:
+
+    def _make_group(self, create_user, album, size, prefix, tracks):
+        members = [
+            create_user(username=f"{prefix}{i}", email=f"{prefix}{i}@test.com")
+            for i in range(size)
+        ]
+        group = Group.objects.create(name=f"Grupo {prefix}", owner=members[0])
+        for offset, member in enumerate(members):
+            group.members.add(member)
+            for idx, track in enumerate(tracks):
+                TrackRanking.objects.create(
+                    user=member,
+                    track=track,
+                    position=(idx + offset) % len(tracks) + 1,
+                )
+        return group, members
+
+    def _get(self, api_client, group, album, user):
+        api_client.force_authenticate(user=user)
+        url = reverse("group-track-compatibility", args=[group.id, album.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(url)
+        return response, len(ctx.captured_queries)
+
+    def test_matrix_matches_duo_formula_with_constant_queries(
+        self, api_client, create_user, albums
+    ):
+        tracks = [
+            Track.objects.create(album=albums[0], title=f"T{i}", track_number=i)
+            for i in range(1, 6)
+        ]
+        small, small_members = self._make_group(create_user, albums[0], 3, "s", tracks)
+        large, large_members = self._make_group(create_user, albums[0], 12, "l", tracks)
+
+        small_response, small_queries = self._get(
+            api_client, small, albums[0], small_members[0]
+        )
+        large_response, large_queries = self._get(
+            api_client, large, albums[0], large_members[0]
+        )
+
+        assert small_response.status_code == status.HTTP_200_OK
+        analysis = small_response.data["collective_analysis"]
+        assert analysis["consensus_track_id"] == tracks[0].id
+        assert analysis["polarization_track_id"] == tracks[3].id
+        assert analysis["full_group_ranking_data"][tracks[1].id] == {
+            "avg_position": 3.0,
+            "std_dev": 1.0,
+        }
+        first_pair = small_response.data["detailed_comparisons"][0]
+        assert (first_pair["user_a"], first_pair["user_b"]) == ("s0", "s1")
+        assert first_pair["percent"] == 68.0
+        assert first_pair["shared_tracks"] == 5
+        assert len(large_response.data["detailed_comparisons"]) == 66
+        assert large_queries == small_queries
+
+
+@pytest.mark.django_db
+class TestBestMatchesView:
+
+    def _seed(self, create_user, albums):
+        def ranked(name, positions, country="BR"):
+            user = create_user(username=name, email=f"{name}@t.com", country=country)
+            for album, position in zip(albums, positions):
+                if position is not None:
+                    AlbumRanking.objects.create(
+                        user=user, album=album, position=position
+                    )
+            return user
+
+        me = ranked("me", (1, 2, 3, 4, 5))
+        twin = ranked("twin", (1, 2, 3, 4, 5), country="US")
+        close = ranked("close", (2, 1, 3, 4, 5))
+        opposite = ranked("opposite", (5, 4, 3, 2, 1))
+        sparse = ranked("sparse", (1, 2, None, None, None))
+        Friendship.objects.create(from_user=opposite, to_user=me, status="accepted")
+        Friendship.objects.create(from_user=me, to_user=close, status="pending")
+        return me, twin, close, opposite, sparse
+
+    def test_ranks_all_users_and_prunes_low_overlap(
+        self, api_client, create_user, albums
+    ):
+        me, twin, close, opposite, _ = self._seed(create_user, albums)
+        api_client.force_authenticate(user=me)
+
+        response = api_client.get(reverse("album-best-matches"), {"k": 2})
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data["results"]
+        assert [r["username"] for r in results] == ["twin", "close"]
+        assert results[0]["compatibility_percent"] == 100.0
+        assert results[1]["compatibility_percent"] == 92.0
+
+        response = api_client.get(reverse("album-best-matches"), {"k": 10})
+        usernames = [r["username"] for r in response.data["results"]]
+        assert usernames == ["twin", "close", "opposite"]
+
+    def test_country_and_friends_filters(self, api_client, create_user, albums):
+        me, *_ = self._seed(create_user, albums)
+        api_client.force_authenticate(user=me)
+        url = reverse("album-best-matches")
+
+        by_country = api_client.get(url, {"country": "BR"}).data["results"]
+        friends = api_client.get(url, {"friends_only": "true"}).data["results"]
+
+        assert [r["username"] for r in by_country] == ["close", "opposite"]
+        assert [r["username"] for r in friends] == ["opposite"]
+
+    def test_candidates_are_scored_in_one_aggregate_query(
+        self, create_user, albums, settings, django_assert_num_queries
+    ):
+        settings.BEST_MATCHES_DIRECT_SCORING_LIMIT = 0
+        me, twin, close, opposite, _ = self._seed(create_user, albums)
+        find_best_matches(me, k=3)
+
+        # Vetores já em cache: só resta a query agregada de candidatos.
+        with django_assert_num_queries(1):
+            matches = find_best_matches(me, k=3)
+
+        assert [match["user_id"] for match in matches] == [
+            twin.id,
+            close.id,
+            opposite.id,
+        ]
+
+        friends = find_best_matches(me, k=3, candidate_ids=[opposite.id, twin.id])
+        assert [match["user_id"] for match in friends] == [twin.id, opposite.id]
+        in_country = find_best_matches(
+            me, k=3, candidate_ids=[opposite.id, twin.id], country="BR"
+        )
+        assert [match["user_id"] for match in in_country] == [opposite.id]
+
+
+@pytest.mark.django_db
+class TestFriendsCompatibilityView:
+
+    def test_friends_sorted_by_compatibility_in_two_queries(
+        self, api_client, create_user, albums
+    ):
+        me = create_user(username="eu", email="eu@t.com")
+        for idx, album in enumerate(albums[:3]):
+            AlbumRanking.objects.create(user=me, album=album, position=idx + 1)
+        friends = {}
+        for name, positions in (
+            ("longe", (3, 2, 1)),
+            ("perto", (1, 2, 3)),
+            ("sem", ()),
+            ("pendente", (1, 2, 3)),
+        ):
+            friend = create_user(username=name, email=f"{name}@t.com")
+            for album, position in zip(albums, positions):
+                AlbumRanking.objects.create(user=friend, album=album, position=position)
+            friends[name] = friend
+        Friendship.objects.create(
+            from_user=me, to_user=friends["longe"], status="accepted"
+        )
+        Friendship.objects.create(
+            from_user=friends["perto"], to_user=me, status="accepted"
+        )
+        Friendship.objects.create(
+            from_user=me, to_user=friends["sem"], status="accepted"
+        )
+        Friendship.objects.create(from_user=me, to_user=friends["pendente"])
+        api_client.force_authenticate(user=me)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(reverse("album-friends-compatibility"))
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data["results"]
+        assert [r["username"] for r in results] == ["perto", "longe", "sem"]
+        assert [r["compatibility_percent"] for r in results] == [100.0, 73.33, 0.0]
+        assert len(ctx.captured_queries) == 2
+
+
+def _bearer(api_client, user):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+
+@pytest.mark.django_db
+class TestTrackCompatibilityView:
+
+    def test_duo_costs_one_ranking_query(self, api_client, create_user, albums):
+        user_a = create_user(username="ta", email="ta@t.com")
+        user_b = create_user(username="tb", email="tb@t.com")
+        tracks = [
+            Track.objects.create(album=albums[0], title=f"T{i}", track_number=i)
+            for i in range(1, 4)
+        ]
+        for idx, track in enumerate(tracks):
+            TrackRanking.objects.create(user=user_a, track=track, position=idx + 1)
+            TrackRanking.objects.create(user=user_b, track=track, position=3 - idx)
+        _bearer(api_client, user_a)
+        url = reverse("track-compatibility-duo", args=[user_b.id, albums[0].id])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["shared_tracks_count"] == 3
+        assert response.data["compatibility_percent"] == 73.33
+        ranking_queries = [
+            q for q in ctx.captured_queries if "rankings_trackranking" in q["sql"]
+        ]
+        assert len(ranking_queries) == 1
+
+    def test_missing_ranking_is_reported(self, api_client, create_user, albums):
+        user_a = create_user(username="ma", email="ma@t.com")
+        user_b = create_user(username="mb", email="mb@t.com")
+        track = Track.objects.create(album=albums[0], title="Solo", track_number=1)
+        TrackRanking.objects.create(user=user_a, track=track, position=1)
+        _bearer(api_client, user_a)
+
+        response = api_client.get(
+            reverse("track-compatibility-duo", args=[user_b.id, albums[0].id])
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "mb" in response.data["error"]
+
+
+@pytest.mark.django_db
+class TestPrecomputedCompatibility:
+
+    def test_duo_served_from_table_until_stale(self, api_client, create_user, albums):
+        user_a = create_user(username="pa", email="pa@t.com")
+        user_b = create_user(username="pb", email="pb@t.com")
+        for idx, album in enumerate(albums[:3]):
+            AlbumRanking.objects.create(user=user_a, album=album, position=idx + 1)
+            AlbumRanking.objects.create(user=user_b, album=album, position=3 - idx)
+        low, high = sorted([user_a.id, user_b.id])
+        score = AlbumCompatibilityScore.objects.create(
+            user_low_id=low, user_high_id=high, percent=42.0, shared_count=3
+        )
+        _bearer(api_client, user_a)
+        url = reverse("album-compatibility", args=[user_b.id])
+
+        assert api_client.get(url).data["compatibility_percent"] == 42.0
+
+        score.is_stale = True
+        score.save()
+        assert api_client.get(url).data["compatibility_percent"] == 73.33
+
+    def test_group_view_reuses_fresh_pairs(self, api_client, create_user, albums):
+        group, members = _make_ranked_group(create_user, albums, 3, "p")
+        low, high = sorted([members[0].id, members[1].id])
+        AlbumCompatibilityScore.objects.create(
+            user_low_id=low, user_high_id=high, percent=1.0, shared_count=5
+        )
+        api_client.force_authenticate(user=members[0])
+
+        response = api_client.get(reverse("group-compatibility", args=[group.id]))
+
+        percents = [pair["percent"] for pair in response.data["detailed_comparisons"]]
+        assert percents[0] == 1.0
+        assert response.data["collective_analysis"]["worst_matching_pair"] == {
+            "percent": 1.0,
+            "users": ("p0", "p1"),
+        }
+
+
+@pytest.mark.django_db
+class TestCountryStatViews:
+
+    def _seed(self, create_user, albums):
+        track = Track.objects.create(album=albums[0], title="Intro", track_number=1)
+        for country in ("BR", "US"):
+            for i in range(2):
+                user = create_user(
+                    username=f"{country}{i}",
+                    email=f"{country}{i}@t.com",
+                    country=country,
+                )
+                for idx, album in enumerate(albums[:2]):
+                    AlbumRanking.objects.create(
+                        user=user, album=album, position=(idx + i) % 2 + 1
+                    )
+                TrackRanking.objects.create(user=user, track=track, position=1)
+        calculate_global_ranking()
+        return track
+
+    def test_album_stats_filter_by_album(self, api_client, create_user, albums):
+        self._seed(create_user, albums)
+        calculate_global_ranking()
+
+        assert CountryAlbumStat.objects.count() == 4
+
+        response = api_client.get(
+            reverse("global-album-stats"), {"album": albums[0].id}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert sorted(row["country_name"] for row in response.data) == ["BR", "US"]
+        row = response.data[0]
+        assert row["album_title"] == albums[0].title
+        assert row["avg_rank"] == 1.5
+        assert row["votes"] == 2
+        assert "analysis_data" not in row
+
+    def test_track_stats_filter_by_country(self, api_client, create_user, albums):
+        track = self._seed(create_user, albums)
+
+        response = api_client.get(
+            reverse("global-track-stats"), {"album": albums[0].id, "country": "BR"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data) == 1
+        assert response.data[0]["track_id"] == track.id
+        assert response.data[0]["track_title"] == "Intro"
+        assert response.data[0]["votes"] == 2
+
+    def test_invalid_filter_returns_400(self, api_client):
+        response = api_client.get(reverse("global-album-stats"), {"album": "abc"})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestGlobalRankingViews:
+
+    @pytest.fixture
+    def ranking(self, albums):
+        return CountryGlobalRanking.objects.create(
+            country_name="Brasil",
+            user_count=3,
+            consensus_album=albums[0],
+            polarization_album=albums[1],
+            analysis_data={str(albums[0].id): {"avg_rank": 1.0}},
+        )
+
+    def test_summary_is_default_and_skips_json_column(self, api_client, ranking):
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(reverse("global-ranking-list"))
+
+        assert response.status_code == status.HTTP_200_OK
+        row = response.data[0]
+        assert row["country_name"] == "Brasil"
+        assert row["consensus_album_title"] == ranking.consensus_album.title
+        assert "analysis_data" not in row
+        assert all("analysis_data" not in q["sql"] for q in ctx.captured_queries)
+
+    def test_include_analysis(self, api_client, ranking):
+        response = api_client.get(
+            reverse("global-ranking-list"), {"include": "analysis"}
+        )
+
+        assert response.data[0]["analysis_data"] == ranking.analysis_data
+
+    def test_fields_selection(self, api_client, ranking):
+        response = api_client.get(
+            reverse("global-ranking-list"), {"fields": "country_name,user_count"}
+        )
+
+        assert response.data[0] == {"country_name": "Brasil", "user_count": 3}
+
+        response = api_client.get(reverse("global-ranking-list"), {"fields": "nope"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_country_detail_returns_full_analysis(self, api_client, ranking):
+        response = api_client.get(reverse("global-ranking-detail", args=["Brasil"]))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["analysis_data"] == ranking.analysis_data
+
+        response = api_client.get(reverse("global-ranking-detail", args=["Narnia"]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestGlobalRankingHttpCache:
+
+    def test_conditional_get_returns_304(self, api_client, create_user, albums):
+        _seed_country(create_user, albums)
+        calculate_global_ranking()
+        url = reverse("global-ranking-list")
+
+        response = api_client.get(url)
+        etag = response["ETag"]
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.has_header("Last-Modified")
+        assert "max-age" in response["Cache-Control"]
+
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        other = api_client.get(url, {"include": "analysis"})
+        assert other["ETag"] != etag
+
+    def test_cached_body_is_served_without_queries(
+        self, api_client, create_user, albums, django_assert_num_queries
+    ):
+        _seed_country(create_user, albums)
+        calculate_global_ranking()
+        url = reverse("global-ranking-list")
+        first = api_client.get(url)
+
+        with django_assert_num_queries(0):
+            second = api_client.get(url)
+
+        assert second.data == first.data
+
+    def test_batch_job_publishes_new_generation(
+        self, api_client, create_user, albums, django_capture_on_commit_callbacks
+    ):
+        _seed_country(create_user, albums)
+        calculate_global_ranking()
+        url = reverse("global-ranking-list")
+        etag = api_client.get(url)["ETag"]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            calculate_global_ranking()
+
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+class TestGlobalRankingHistoryView:
+
+    def test_album_series_for_country(self, api_client, create_user, albums):
+        _seed_country(create_user, albums)
+        calculate_global_ranking()
+        AlbumRanking.objects.filter(album=albums[0], position=2).update(position=3)
+        calculate_global_ranking()
+
+        response = api_client.get(
+            reverse("global-ranking-history"),
+            {"country": "Brasil", "album": albums[0].id, "since": "2000-01-01"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [point["avg_rank"] for point in response.data] == [1.5, 2.0]
+        assert response.data[0]["country_name"] == "Brasil"
+
+    def test_requires_country(self, api_client):
+        url = reverse("global-ranking-history")
+
+        assert api_client.get(url).status_code == status.HTTP_400_BAD_REQUEST
+        response = api_client.get(url, {"album": 1})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = api_client.get(url, {"country": "Brasil", "since": "ontem"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestCountryCompatibilityViews:
+
+    def _seed(self, create_user, albums):
+        for country, positions in (("X", (1, 2)), ("Y", (2, 1)), ("Z", (1, 2))):
+            for i in range(2):
+                user = create_user(
+                    username=f"{country}{i}",
+                    email=f"{country}{i}@t.com",
+                    country=country,
+                )
+                for album, position in zip(albums, positions):
+                    AlbumRanking.objects.create(
+                        user=user, album=album, position=position
+                    )
+        calculate_global_ranking()
+
+    def test_compare_two_countries_without_ranking_tables(
+        self, api_client, create_user, albums
+    ):
+        self._seed(create_user, albums)
+        url = reverse("country-compatibility", args=["X", "Y"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["compatibility_percent"] == 80.0
+        assert response.data["shared_albums_count"] == 2
+        assert len(ctx.captured_queries) == 1
+        assert "albumranking" not in ctx.captured_queries[0]["sql"]
+
+        missing = api_client.get(reverse("country-compatibility", args=["X", "Nope"]))
+        assert missing.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_matrix_tolerates_vectors_with_divergent_order(
+        self, api_client, create_user, albums
+    ):
+        self._seed(create_user, albums)
+        # Simula um país recalculado depois de uma release_date editada.
+        x = CountryGlobalRanking.objects.get(country_name="X")
+        album_ids, ranks = x.album_vector()
+        x.set_album_vector(list(reversed(album_ids)), list(reversed(ranks)))
+        x.save()
+
+        response = api_client.get(reverse("country-compatibility-matrix"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["best_pair"]["compatibility_percent"] == 100.0
+
+    def test_all_pairs_matrix(self, api_client, create_user, albums):
+        self._seed(create_user, albums)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(reverse("country-compatibility-matrix"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not any("albums_album" in q["sql"] for q in ctx.captured_queries)
+        assert len(response.data["pairs"]) == 3
+        assert response.data["best_pair"] == {
+            "country_a": "X",
+            "country_b": "Z",
+            "compatibility_percent": 100.0,
+            "shared_albums_count": 2,
+        }
+        assert response.data["worst_pair"]["compatibility_percent"] == 80.0
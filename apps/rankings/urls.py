@@ -4,11 +4,20 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     AlbumRankingView,
     TrackRankingView,
+    RankingImportView,
     CompatibilityView,
+    BestMatchesView,
+    FriendsCompatibilityView,
     GroupCompatibilityView,
     GroupTrackCompatibilityView,
     GlobalRankingListView,
+    GlobalRankingDetailView,
+    GlobalRankingHistoryView,
+    CountryAlbumStatListView,
+    CountryTrackStatListView,
     TrackCompatibilityView,
+    CountryCompatibilityView,
+    CountryCompatibilityMatrixView,
     GroupRankingViewSet,
     UserRankedTitlesView,
     OtherUserRankedTitlesView,
@@ -25,6 +34,17 @@ urlpatterns = [
         TrackRankingView.as_view(),
         name="track-ranking-by-album",
     ),
+    path("import/", RankingImportView.as_view(), name="ranking-import"),
+    path(
+        "compare/albums/best-matches/",
+        BestMatchesView.as_view(),
+        name="album-best-matches",
+    ),
+    path(
+        "compare/albums/friends/",
+        FriendsCompatibilityView.as_view(),
+        name="album-friends-compatibility",
+    ),
     path(
         "compare/albums/<int:target_user_id>/",
         CompatibilityView.as_view(),
@@ -45,7 +65,37 @@ urlpatterns = [
         GroupTrackCompatibilityView.as_view(),
         name="group-track-compatibility",
     ),
+    path(
+        "compare/countries/",
+        CountryCompatibilityMatrixView.as_view(),
+        name="country-compatibility-matrix",
+    ),
+    path(
+        "compare/countries/<str:country_a>/<str:country_b>/",
+        CountryCompatibilityView.as_view(),
+        name="country-compatibility",
+    ),
     path("global/", GlobalRankingListView.as_view(), name="global-ranking-list"),
+    path(
+        "global/albums/",
+        CountryAlbumStatListView.as_view(),
+        name="global-album-stats",
+    ),
+    path(
+        "global/tracks/",
+        CountryTrackStatListView.as_view(),
+        name="global-track-stats",
+    ),
+    path(
+        "global/history/",
+        GlobalRankingHistoryView.as_view(),
+        name="global-ranking-history",
+    ),
+    path(
+        "global/<str:country_name>/",
+        GlobalRankingDetailView.as_view(),
+        name="global-ranking-detail",
+    ),
     path(
         "user/ranked-titles/", UserRankedTitlesView.as_view(), name="user-ranked-titles"
     ),
@@ -1,10 +1,37 @@
 import logging
-import statistics
+import math
 from collections import defaultdict
+from itertools import combinations
+from datetime import timedelta
+from graphlib import CycleError, TopologicalSorter
 from typing import Dict
 
 from django.apps import apps
-from django.db.models import Avg, Count, F
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    Avg,
+    Case,
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    Q,
+    StdDev,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Abs, Cast, Least
+from django.utils import timezone
+
+from .cache import (
+    RankingVector,
+    get_album_vector,
+    get_album_vectors,
+    get_track_vectors,
+    refresh_global_ranking_generation,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +54,15 @@ TrackRanking = _get_model("rankings", "TrackRanking") or _get_model(
 )
 CountryGlobalRanking = _get_model("rankings", "CountryGlobalRanking")
 Group = _get_model("social", "Group")
+Friendship = _get_model("social", "Friendship")
+GroupMembership = _get_model("social", "GroupMembership")
+AlbumCompatibilityScore = _get_model("rankings", "AlbumCompatibilityScore")
 GroupRanking = _get_model("rankings", "GroupRanking")
+DirtyCountry = _get_model("rankings", "DirtyCountry")
+CountryAlbumStat = _get_model("rankings", "CountryAlbumStat")
+CountryTrackStat = _get_model("rankings", "CountryTrackStat")
+GlobalRankingRun = _get_model("rankings", "GlobalRankingRun")
+CountryRankingSnapshot = _get_model("rankings", "CountryRankingSnapshot")
 
 
 def get_album_map() -> Dict[int, object]:
@@ -51,21 +86,14 @@ def get_album_map() -> Dict[int, object]:
     return album_map
 
 
-def _calculate_compatibility_from_queryset(shared_rankings, id_field_name):
+def _calculate_compatibility_from_pairs(pairs, id_field_name):
     """
-    Helper que recebe um queryset já convertido em .values(...) com keys:
-    - id_field_name (ex: 'album_id' or 'track_id')
-    - 'position'
-    - 'user_b_position'
+    Núcleo em memória do cálculo de compatibilidade.
+    Recebe uma sequência de tuplas (item_id, pos_a, pos_b) já pareadas,
+    na ordem em que os empates devem ser resolvidos (o primeiro vence).
     Retorna (percent, count, report)
     """
-    num_shared = (
-        shared_rankings.count()
-        if hasattr(shared_rankings, "count")
-        else len(list(shared_rankings))
-    )
-    if num_shared == 0:
-        return 0.0, 0, {}
+    num_shared = 0
 
     min_sum = float("inf")
     max_sum = float("-inf")
@@ -79,31 +107,30 @@ def _calculate_compatibility_from_queryset(shared_rankings, id_field_name):
 
     total_abs_diff = 0
 
-    for item in shared_rankings:
-        pos_a = item.get("position")
-        pos_b = item.get("user_b_position")
+    for item_id, pos_a, pos_b in pairs:
         if pos_a is None or pos_b is None:
             continue
 
+        num_shared += 1
         sum_pos = pos_a + pos_b
         abs_diff = abs(pos_a - pos_b)
         total_abs_diff += abs_diff
 
         if sum_pos < min_sum:
             min_sum = sum_pos
-            fav_id = item.get(id_field_name)
+            fav_id = item_id
 
         if sum_pos > max_sum:
             max_sum = sum_pos
-            least_id = item.get(id_field_name)
+            least_id = item_id
 
         if abs_diff > max_diff:
             max_diff = abs_diff
-            most_div_id = item.get(id_field_name)
+            most_div_id = item_id
 
         if abs_diff < min_diff:
             min_diff = abs_diff
-            most_conc_id = item.get(id_field_name)
+            most_conc_id = item_id
 
     if num_shared == 0:
         return 0.0, 0, {}
@@ -124,10 +151,40 @@ def _calculate_compatibility_from_queryset(shared_rankings, id_field_name):
     return round(compatibility_percent, 2), num_shared, report
 
 
+def _calculate_compatibility_from_queryset(shared_rankings, id_field_name):
+    """
+    Helper que recebe um queryset já convertido em .values(...) com keys:
+    - id_field_name (ex: 'album_id' or 'track_id')
+    - 'position'
+    - 'user_b_position'
+    Retorna (percent, count, report)
+    """
+    pairs = [
+        (item.get(id_field_name), item.get("position"), item.get("user_b_position"))
+        for item in shared_rankings
+    ]
+    return _calculate_compatibility_from_pairs(pairs, id_field_name)
+
+
+def _pair_vectors(vector_a, vector_b):
+    """
+    Pareia dois RankingVector, mantendo a ordem de vector_a.
+    Retorna [(item_id, pos_a, pos_b), ...] apenas com os itens em comum.
+    """
+    positions_b = dict(zip(vector_b.item_ids, vector_b.positions))
+    return [
+        (item_id, pos_a, positions_b[item_id])
+        for item_id, pos_a in zip(vector_a.item_ids, vector_a.positions)
+        if item_id in positions_b
+    ]
+
+
 def calculate_album_compatibility(user_a, user_b):
     """
     Retorna (percent: float, num_shared_albums: int, analysis_report: dict).
-    Compatível com related_name 'user_rankings' no modelo Album (fallback robusto).
+    Usa os vetores (album_id, position) em cache dos dois usuários; os ausentes
+    são carregados em uma única query e o pareamento é feito em memória,
+    seguindo a ordem padrão de Album (release_date) para o desempate.
     """
     if User is None or AlbumRanking is None or Album is None:
         return 0.0, 0, {}
@@ -135,149 +192,1009 @@ def calculate_album_compatibility(user_a, user_b):
     if user_a.id == user_b.id:
         return 100.0, 0, {}
 
-    try:
-        shared_albums_qs = (
-            Album.objects.filter(user_rankings__user=user_a)
-            .filter(user_rankings__user=user_b)
-            .distinct()
+    vectors = get_album_vectors([user_a.id, user_b.id])
+    pairs = _pair_vectors(vectors[user_a.id], vectors[user_b.id])
+
+    return _calculate_compatibility_from_pairs(pairs, "album_id")
+
+
+def calculate_track_compatibility(user_a, user_b, album, vectors=None):
+    """
+    Calcula compatibilidade entre TrackRanking de dois usuários PARA UM ÁLBUM ESPECÍFICO.
+    As posições dos dois usuários vêm de uma única query indexada
+    (user_id IN (a, b) AND track__album_id = X), ou de vectors já carregados,
+    e são pareadas em memória.
+    Retorna (percent, num_shared_tracks, analysis_report).
+    """
+    if TrackRanking is None or Track is None:
+        return 0.0, 0, {}
+
+    if user_a.id == user_b.id:
+        return 100.0, 0, {}
+
+    if vectors is None:
+        vectors = get_track_vectors([user_a.id, user_b.id], album.id)
+    pairs = _pair_vectors(vectors[user_a.id], vectors[user_b.id])
+
+    return _calculate_compatibility_from_pairs(pairs, "track_id")
+
+
+def get_friends(user_id):
+    """
+    Retorna { friend_id: username } dos amigos (amizade aceita, em qualquer
+    direção) de um usuário, em uma única query.
+    """
+    if Friendship is None:
+        return {}
+
+    friends = {}
+    for from_id, from_username, to_id, to_username in Friendship.objects.filter(
+        Q(from_user_id=user_id) | Q(to_user_id=user_id), status="accepted"
+    ).values_list(
+        "from_user_id", "from_user__username", "to_user_id", "to_user__username"
+    ):
+        if from_id == user_id:
+            friends[to_id] = to_username
+        else:
+            friends[from_id] = from_username
+    friends.pop(user_id, None)
+    return friends
+
+
+def get_friend_ids(user_id):
+    """Ids dos amigos (amizade aceita, em qualquer direção) de um usuário."""
+    return set(get_friends(user_id))
+
+
+def calculate_friends_leaderboard(user_id):
+    """
+    Compatibilidade de álbuns do usuário com todos os seus amigos, calculada
+    em lote a partir dos vetores (uma query para os amigos e no máximo uma
+    para os rankings). Ordenado por percentual, álbuns em comum e username;
+    amigos sem álbuns em comum ficam no fim com percent 0.
+    Retorna [ {"user_id", "username", "percent", "shared", "report"}, ... ].
+    """
+    friends = get_friends(user_id)
+    vectors = get_album_vectors([user_id, *friends])
+    my_vector = vectors[user_id]
+
+    leaderboard = []
+    for friend_id, username in friends.items():
+        percent, num_shared, report = _calculate_compatibility_from_pairs(
+            _pair_vectors(my_vector, vectors[friend_id]), "album_id"
         )
-    except Exception:
-        album_ids_a = AlbumRanking.objects.filter(user=user_a).values_list(
-            "album_id", flat=True
+        leaderboard.append(
+            {
+                "user_id": friend_id,
+                "username": username,
+                "percent": percent,
+                "shared": num_shared,
+                "report": report,
+            }
         )
-        album_ids_b = AlbumRanking.objects.filter(user=user_b).values_list(
-            "album_id", flat=True
+
+    leaderboard.sort(
+        key=lambda entry: (-entry["percent"], -entry["shared"], entry["username"])
+    )
+    return leaderboard
+
+
+def _best_match_shortlist(
+    user_id, my_vector, limit, min_shared, candidate_ids, country
+):
+    """
+    Pontua os candidatos no banco com um único agregado: para cada usuário
+    que rankeou algum álbum do vetor, conta os álbuns em comum e soma as
+    diferenças absolutas de posição. Retorna os limit melhores user_ids pela
+    mesma fórmula de calculate_album_compatibility (sem arredondamento).
+    """
+    my_position = Case(
+        *[
+            When(album_id=album_id, then=Value(position))
+            for album_id, position in zip(my_vector.item_ids, my_vector.positions)
+        ],
+        output_field=IntegerField(),
+    )
+    rows = AlbumRanking.objects.filter(album_id__in=list(my_vector.item_ids)).exclude(
+        user_id=user_id
+    )
+    if candidate_ids is not None:
+        rows = rows.filter(user_id__in=candidate_ids)
+    if country:
+        rows = rows.filter(user__country=country)
+
+    return list(
+        rows.values("user_id")
+        .annotate(
+            shared=Count("id"),
+            total_abs_diff=Sum(Abs(F("position") - my_position)),
+        )
+        .filter(shared__gte=min_shared)
+        .annotate(
+            avg_abs_diff=Least(
+                Cast("total_abs_diff", FloatField()) / F("shared"),
+                Value(5.0),
+                output_field=FloatField(),
+            )
         )
-        shared_ids = set(album_ids_a).intersection(set(album_ids_b))
-        shared_albums_qs = Album.objects.filter(id__in=list(shared_ids))
+        .order_by("avg_abs_diff", "-shared", "user_id")
+        .values_list("user_id", flat=True)[:limit]
+    )
 
-    num_shared_albums = shared_albums_qs.count()
-    if num_shared_albums == 0:
-        return 0.0, 0, {}
 
-    min_sum = float("inf")
-    max_sum = float("-inf")
-    max_diff = -1
-    min_diff = float("inf")
+def find_best_matches(user, k=10, candidate_ids=None, min_shared=None, country=None):
+    """
+    Retorna os k usuários mais compatíveis com user (mesma fórmula de
+    calculate_album_compatibility), em ordem decrescente de percentual:
+    [ {"user_id", "percent", "shared", "report"}, ... ].
+    candidate_ids (ex.: amigos) e country restringem a busca. Candidatos com
+    menos de min_shared álbuns em comum são descartados.
+
+    Para candidatos restritos a um conjunto pequeno, compara direto os
+    vetores. Caso contrário o banco pontua todos os candidatos em uma única
+    query agregada, e só os melhores 2k são recalculados com os vetores
+    exatos (para o relatório e o arredondamento do percentual).
+    """
+    my_vector = get_album_vector(user.id)
+    if not my_vector.item_ids or k <= 0:
+        return []
+
+    if min_shared is None:
+        min_shared = getattr(settings, "BEST_MATCHES_MIN_SHARED_ALBUMS", 3)
+    min_shared = max(1, min(min_shared, len(my_vector.item_ids)))
+
+    if candidate_ids is not None:
+        candidate_ids = set(candidate_ids)
+        candidate_ids.discard(user.id)
+        if candidate_ids and country:
+            candidate_ids = set(
+                User.objects.filter(id__in=candidate_ids, country=country).values_list(
+                    "id", flat=True
+                )
+            )
+            country = None
+        if not candidate_ids:
+            return []
+
+    direct_limit = getattr(settings, "BEST_MATCHES_DIRECT_SCORING_LIMIT", 500)
+    if candidate_ids is not None and len(candidate_ids) <= direct_limit:
+        shortlist = list(candidate_ids)
+    else:
+        shortlist = _best_match_shortlist(
+            user.id, my_vector, 2 * k, min_shared, candidate_ids, country
+        )
 
-    favorite_album = None
-    least_favorite_album = None
-    most_divergent_album = None
-    most_concordant_album = None
+    vectors = get_album_vectors(shortlist)
+    matches = []
+    for other_id in shortlist:
+        percent, num_shared, report = _calculate_compatibility_from_pairs(
+            _pair_vectors(my_vector, vectors[other_id]), "album_id"
+        )
+        if num_shared < min_shared:
+            continue
+        matches.append(
+            {
+                "user_id": other_id,
+                "percent": percent,
+                "shared": num_shared,
+                "report": report,
+            }
+        )
 
-    total_abs_diff = 0
-    processed_count = 0
+    matches.sort(
+        key=lambda match: (-match["percent"], -match["shared"], match["user_id"])
+    )
+    return matches[:k]
 
-    for album in shared_albums_qs:
-        try:
-            pos_a = AlbumRanking.objects.get(user=user_a, album=album).position
-            pos_b = AlbumRanking.objects.get(user=user_b, album=album).position
-        except AlbumRanking.DoesNotExist:
+
+def _build_ranking_matrix(user_ids, vectors, columns):
+    """
+    Monta a matriz densa usuários × itens (None onde o usuário não rankeou).
+    As linhas seguem user_ids e as colunas seguem columns.
+    """
+    column_index = {item_id: idx for idx, item_id in enumerate(columns)}
+    matrix = []
+    for user_id in user_ids:
+        row = [None] * len(columns)
+        vector = vectors.get(user_id)
+        if vector is not None:
+            for item_id, position in zip(vector.item_ids, vector.positions):
+                idx = column_index.get(item_id)
+                if idx is not None:
+                    row[idx] = position
+        matrix.append(row)
+    return matrix
+
+
+def _sample_std_dev(count, total, total_sq):
+    """Desvio padrão amostral a partir de (contagem, soma, soma dos quadrados)."""
+    if count < 2:
+        return 0.0
+    variance = (total_sq - total * total / count) / (count - 1)
+    return math.sqrt(max(0.0, variance))
+
+
+def aggregate_group_positions(vectors, columns):
+    """
+    Etapa de agregação coletiva do grupo: percorre uma única vez as posições
+    de todos os membros (cada membro contado uma vez) acumulando contagem,
+    soma e soma dos quadrados por item.
+    Retorna { item_id: {"avg_position", "std_dev"} } na ordem de columns,
+    apenas para itens com pelo menos 2 votos.
+    """
+    accumulators = {item_id: [0, 0, 0] for item_id in columns}
+    for vector in vectors.values():
+        for item_id, position in zip(vector.item_ids, vector.positions):
+            acc = accumulators.get(item_id)
+            if acc is None:
+                continue
+            acc[0] += 1
+            acc[1] += position
+            acc[2] += position * position
+
+    item_stats = {}
+    for item_id, (count, total, total_sq) in accumulators.items():
+        if count < 2:
             continue
+        item_stats[item_id] = {
+            "avg_position": round(total / count, 2),
+            "std_dev": round(_sample_std_dev(count, total, total_sq), 2),
+        }
+    return item_stats
 
-        processed_count += 1
-        sum_pos = pos_a + pos_b
-        abs_diff = abs(pos_a - pos_b)
-        total_abs_diff += abs_diff
 
-        if sum_pos < min_sum:
-            min_sum = sum_pos
-            favorite_album = album.id
+def summarize_collective_analysis(item_stats):
+    """
+    A partir do resultado de aggregate_group_positions, retorna
+    (consensus_id, discord_id, polarization_id): menor média, maior média e
+    maior desvio padrão, respectivamente.
+    """
+    consensus_id = min(
+        item_stats, key=lambda id: item_stats[id]["avg_position"], default=None
+    )
+    discord_id = max(
+        item_stats, key=lambda id: item_stats[id]["avg_position"], default=None
+    )
+    polarization_id = max(
+        item_stats, key=lambda id: item_stats[id]["std_dev"], default=None
+    )
+    return consensus_id, discord_id, polarization_id
 
-        if sum_pos > max_sum:
-            max_sum = sum_pos
-            least_favorite_album = album.id
 
-        if abs_diff > max_diff:
-            max_diff = abs_diff
-            most_divergent_album = album.id
+def calculate_group_compatibility_matrix(
+    user_ids, vectors, columns, id_field_name, pair_scores=None, item_stats=True
+):
+    """
+    Calcula, em uma única passada sobre a matriz usuários × itens, a
+    compatibilidade de todos os pares (mesma fórmula do duo) e o melhor e o
+    pior par. A média/desvio padrão de cada item vem de
+    aggregate_group_positions.
+    Não acessa o banco: recebe os vetores já carregados. Pares presentes em
+    pair_scores ({(menor_id, maior_id): (percent, count, report)}) são
+    reaproveitados em vez de recalculados.
+    Retorna dict com "pairs", "best_pair", "worst_pair", "average_percent"
+    e, se item_stats for verdadeiro, "item_stats".
+    """
+    user_ids = list(user_ids)
+    columns = list(columns)
+    matrix = _build_ranking_matrix(user_ids, vectors, columns)
+
+    pairs = []
+    best_pair = None
+    worst_pair = None
+    total_percent = 0.0
+
+    for i in range(len(user_ids)):
+        row_a = matrix[i]
+        for j in range(i + 1, len(user_ids)):
+            row_b = matrix[j]
+            precomputed = (pair_scores or {}).get(
+                _ordered_pair(user_ids[i], user_ids[j])
+            )
+            if precomputed is not None:
+                percent, num_shared, report = precomputed
+            else:
+                shared = [
+                    (columns[k], pos_a, row_b[k])
+                    for k, pos_a in enumerate(row_a)
+                    if pos_a is not None and row_b[k] is not None
+                ]
+                percent, num_shared, report = _calculate_compatibility_from_pairs(
+                    shared, id_field_name
+                )
+            pair = {
+                "user_a_id": user_ids[i],
+                "user_b_id": user_ids[j],
+                "percent": percent,
+                "shared": num_shared,
+                "report": report,
+            }
+            pairs.append(pair)
+            total_percent += percent
+
+            if best_pair is None or percent > best_pair["percent"]:
+                best_pair = pair
+            if worst_pair is None or percent < worst_pair["percent"]:
+                worst_pair = pair
+
+    result = {
+        "pairs": pairs,
+        "best_pair": best_pair,
+        "worst_pair": worst_pair,
+        "average_percent": (round(total_percent / len(pairs), 2) if pairs else 0.0),
+    }
+    if item_stats:
+        result["item_stats"] = aggregate_group_positions(vectors, columns)
+    return result
 
-        if abs_diff < min_diff:
-            min_diff = abs_diff
-            most_concordant_album = album.id
 
-    if processed_count == 0:
-        return 0.0, 0, {}
+def calculate_group_album_matrix(user_ids, vectors=None, pair_scores=None):
+    """
+    Versão de calculate_group_compatibility_matrix para rankings de álbuns.
+    As colunas seguem a ordem padrão de Album (release_date), a mesma usada
+    no desempate de calculate_album_compatibility.
+    """
+    user_ids = list(user_ids)
+    if vectors is None:
+        vectors = get_album_vectors(user_ids)
+
+    ranked_album_ids = set()
+    for vector in vectors.values():
+        ranked_album_ids.update(vector.item_ids)
+
+    columns = []
+    if ranked_album_ids and Album is not None:
+        columns = list(
+            Album.objects.filter(id__in=ranked_album_ids)
+            .order_by("release_date", "id")
+            .values_list("id", flat=True)
+        )
 
-    avg_abs_diff = total_abs_diff / processed_count
-    max_diff_reference = 5.0
-    compatibility_percent = max(0.0, 100.0 * (1 - (avg_abs_diff / max_diff_reference)))
+    return calculate_group_compatibility_matrix(
+        user_ids, vectors, columns, "album_id", pair_scores=pair_scores
+    )
 
-    analysis_report = {
-        "favorite_album_id": favorite_album,
-        "least_favorite_album_id": least_favorite_album,
-        "most_divergent_album_id": most_divergent_album,
-        "most_concordant_album_id": most_concordant_album,
-        "max_position_difference": max_diff,
-        "min_position_difference": min_diff,
+
+def _ordered_pair(user_a_id, user_b_id):
+    return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+
+def get_compatibility_pairs(user_ids=None):
+    """
+    Pares (menor_id, maior_id) cuja compatibilidade de álbuns é pré-calculada:
+    amizades aceitas e membros de um mesmo grupo. Com user_ids, apenas os
+    pares que envolvem esses usuários.
+    """
+    pairs = set()
+    user_ids = set(user_ids) if user_ids is not None else None
+
+    if Friendship is not None:
+        friendships = Friendship.objects.filter(status="accepted")
+        if user_ids is not None:
+            friendships = friendships.filter(
+                Q(from_user_id__in=user_ids) | Q(to_user_id__in=user_ids)
+            )
+        for from_user_id, to_user_id in friendships.values_list(
+            "from_user_id", "to_user_id"
+        ):
+            if from_user_id != to_user_id:
+                pairs.add(_ordered_pair(from_user_id, to_user_id))
+
+    if GroupMembership is not None:
+        memberships = GroupMembership.objects.all()
+        if user_ids is not None:
+            memberships = memberships.filter(
+                group_id__in=GroupMembership.objects.filter(
+                    user_id__in=user_ids
+                ).values("group_id")
+            )
+        members_by_group = defaultdict(list)
+        for group_id, user_id in memberships.order_by(
+            "group_id", "user_id"
+        ).values_list("group_id", "user_id"):
+            members_by_group[group_id].append(user_id)
+        for members in members_by_group.values():
+            if user_ids is None:
+                pairs.update(combinations(members, 2))
+                continue
+            # Apenas os usuários pedidos contra os demais membros: O(M) por
+            # grupo, em vez de gerar todos os pares do grupo e filtrar.
+            for user_id in user_ids.intersection(members):
+                pairs.update(
+                    _ordered_pair(user_id, other_id)
+                    for other_id in members
+                    if other_id != user_id
+                )
+
+    return pairs
+
+
+def _score_rows(pairs):
+    vectors = get_album_vectors({user_id for pair in pairs for user_id in pair})
+    computed_at = timezone.now()
+    rows = []
+    for user_low_id, user_high_id in pairs:
+        percent, num_shared, report = _calculate_compatibility_from_pairs(
+            _pair_vectors(vectors[user_low_id], vectors[user_high_id]), "album_id"
+        )
+        rows.append(
+            AlbumCompatibilityScore(
+                user_low_id=user_low_id,
+                user_high_id=user_high_id,
+                percent=percent,
+                shared_count=num_shared,
+                report=report,
+                is_stale=False,
+                computed_at=computed_at,
+            )
+        )
+    return rows
+
+
+def _stale_versions(pairs):
+    """Retorna {(menor_id, maior_id): (id, stale_version)} dos pares já gravados."""
+    wanted = set(pairs)
+    rows = AlbumCompatibilityScore.objects.filter(
+        user_low_id__in={pair[0] for pair in wanted},
+        user_high_id__in={pair[1] for pair in wanted},
+    ).values_list("id", "user_low_id", "user_high_id", "stale_version")
+    return {
+        (user_low_id, user_high_id): (score_id, version)
+        for score_id, user_low_id, user_high_id, version in rows
+        if (user_low_id, user_high_id) in wanted
     }
 
-    return round(compatibility_percent, 2), processed_count, analysis_report
+
+def save_compatibility_scores(pairs):
+    """
+    Calcula e grava (upsert em lotes de GLOBAL_RANKING_CHUNK_SIZE) a
+    compatibilidade de álbuns dos pares informados. Retorna quantos pares
+    foram gravados.
+    As versões de marcação são lidas antes dos vetores: pares marcados como
+    desatualizados durante o cálculo voltam a is_stale=True na mesma
+    transação do upsert, em vez de servirem um percentual antigo como novo.
+    """
+    if AlbumCompatibilityScore is None:
+        return 0
+
+    pairs = sorted(pairs)
+    chunk_size = _chunk_size()
+    for start in range(0, len(pairs), chunk_size):
+        end = start + chunk_size
+        chunk = pairs[start:end]
+        versions_read = _stale_versions(chunk)
+        rows = _score_rows(chunk)
+        with transaction.atomic():
+            AlbumCompatibilityScore.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["user_low", "user_high"],
+                update_fields=[
+                    "percent",
+                    "shared_count",
+                    "report",
+                    "is_stale",
+                    "computed_at",
+                ],
+            )
+            marked_meanwhile = [
+                score_id
+                for pair, (score_id, version) in _stale_versions(chunk).items()
+                if version != versions_read.get(pair, (None, 0))[1]
+            ]
+            if marked_meanwhile:
+                AlbumCompatibilityScore.objects.filter(id__in=marked_meanwhile).update(
+                    is_stale=True
+                )
+    return len(pairs)
 
 
-def calculate_track_compatibility(user_a, user_b, album):
+def precompute_compatibility_scores():
     """
-    Calcula compatibilidade entre TrackRanking de dois usuários PARA UM ÁLBUM ESPECÍFICO.
-    Retorna (percent, num_shared_tracks, analysis_report).
+    Recalcula a compatibilidade de todos os pares de amigos e membros de
+    grupos e remove os pares que deixaram de se qualificar.
     """
-    if TrackRanking is None or Track is None:
-        return 0.0, 0, {}
+    if AlbumCompatibilityScore is None:
+        return 0
 
-    if user_a.id == user_b.id:
-        return 100.0, 0, {}
+    pairs = get_compatibility_pairs()
+    chunk_size = _chunk_size()
+    stored = AlbumCompatibilityScore.objects.values_list(
+        "id", "user_low_id", "user_high_id"
+    ).iterator(chunk_size=chunk_size)
+    obsolete = [
+        score_id
+        for score_id, user_low_id, user_high_id in stored
+        if (user_low_id, user_high_id) not in pairs
+    ]
+    for start in range(0, len(obsolete), chunk_size):
+        end = start + chunk_size
+        AlbumCompatibilityScore.objects.filter(id__in=obsolete[start:end]).delete()
+
+    return save_compatibility_scores(pairs)
+
+
+def refresh_user_compatibility_scores(user_id):
+    """Recalcula os pares pré-calculáveis que envolvem o usuário."""
+    return save_compatibility_scores(get_compatibility_pairs([user_id]))
+
+
+def mark_compatibility_scores_stale(user_id):
+    """
+    Marca os pares do usuário como desatualizados. Pares já marcados também
+    têm stale_version incrementado, para que um recálculo em andamento saiba
+    que leu vetores anteriores a esta escrita.
+    """
+    if AlbumCompatibilityScore is None:
+        return 0
+    return AlbumCompatibilityScore.objects.filter(
+        Q(user_low_id=user_id) | Q(user_high_id=user_id)
+    ).update(is_stale=True, stale_version=F("stale_version") + 1)
+
+
+def get_precomputed_compatibility(user_ids):
+    """
+    Retorna {(menor_id, maior_id): (percent, count, report)} com os pares
+    pré-calculados e atualizados entre os usuários informados (uma query).
+    Pares ausentes ou desatualizados ficam de fora e devem ser calculados
+    na hora.
+    """
+    user_ids = list(set(user_ids))
+    if AlbumCompatibilityScore is None or len(user_ids) < 2:
+        return {}
+
+    rows = AlbumCompatibilityScore.objects.filter(
+        user_low_id__in=user_ids, user_high_id__in=user_ids, is_stale=False
+    ).values_list("user_low_id", "user_high_id", "percent", "shared_count", "report")
+    return {
+        (user_low_id, user_high_id): (percent, shared_count, report)
+        for user_low_id, user_high_id, percent, shared_count, report in rows
+    }
+
+
+def get_album_compatibility(user_a, user_b):
+    """
+    Como calculate_album_compatibility, mas serve o par de
+    AlbumCompatibilityScore quando ele existe e está atualizado.
+    """
+    if user_a.id != user_b.id:
+        precomputed = get_precomputed_compatibility([user_a.id, user_b.id]).get(
+            _ordered_pair(user_a.id, user_b.id)
+        )
+        if precomputed is not None:
+            return precomputed
+    return calculate_album_compatibility(user_a, user_b)
+
+
+def calculate_group_track_matrix(user_ids, album_id, vectors=None):
+    """
+    Versão de calculate_group_compatibility_matrix para as músicas de um álbum.
+    As colunas seguem a ordem por track_id, a mesma usada no desempate de
+    calculate_track_compatibility.
+    """
+    user_ids = list(user_ids)
+    if vectors is None:
+        vectors = get_track_vectors(user_ids, album_id)
+
+    columns = set()
+    for vector in vectors.values():
+        columns.update(vector.item_ids)
 
-    rankings_a = TrackRanking.objects.filter(user=user_a, track__album=album).order_by(
-        "track_id"
+    return calculate_group_compatibility_matrix(
+        user_ids, vectors, sorted(columns), "track_id"
     )
-    rankings_b = TrackRanking.objects.filter(user=user_b, track__album=album).order_by(
-        "track_id"
+
+
+def get_country_vectors(rankings):
+    """
+    Retorna { country_name: RankingVector(album_ids, avg_ranks) } a partir dos
+    CountryGlobalRanking já carregados (vetores gravados pelo cálculo global).
+    """
+    return {
+        ranking.country_name: RankingVector(*ranking.album_vector())
+        for ranking in rankings
+    }
+
+
+def calculate_country_compatibility(ranking_a, ranking_b):
+    """
+    Compatibilidade entre dois países usando as posições médias gravadas pelo
+    cálculo global e a mesma fórmula do duo de usuários.
+    Retorna (percent, num_shared_albums, analysis_report).
+    """
+    vectors = get_country_vectors([ranking_a, ranking_b])
+    pairs = _pair_vectors(
+        vectors[ranking_a.country_name], vectors[ranking_b.country_name]
     )
-    track_ids_b = rankings_b.values_list("track_id", flat=True)
-
-    shared_rankings_qs = (
-        rankings_a.filter(track_id__in=track_ids_b)
-        .annotate(user_b_position=F("track__user_rankings__position"))
-        .filter(track__user_rankings__user=user_b)
-        .values("track_id", "position", "user_b_position")
-        .distinct()
+    return _calculate_compatibility_from_pairs(pairs, "album_id")
+
+
+def _merged_release_order(vectors):
+    """
+    Une os álbuns dos vetores em uma única ordem de colunas. Cada vetor já
+    está na ordem padrão de Album (release_date), então uma ordenação
+    topológica das sequências respeita a ordem de todos eles sem consultar
+    o banco. Se os vetores discordarem (ex.: release_date editada e só parte
+    dos países recalculada), cai para a ordem dos ids.
+    """
+    sorter = TopologicalSorter()
+    for vector in vectors.values():
+        previous = None
+        for album_id in vector.item_ids:
+            if previous is None:
+                sorter.add(album_id)
+            else:
+                sorter.add(album_id, previous)
+            previous = album_id
+    try:
+        return list(sorter.static_order())
+    except CycleError:
+        logger.warning(
+            "Vetores de países com ordens de álbuns divergentes; usando ordem por id."
+        )
+        return sorted(
+            {album_id for vector in vectors.values() for album_id in vector.item_ids}
+        )
+
+
+def calculate_country_matrix(rankings):
+    """
+    Matriz de compatibilidade entre todos os pares de países, a partir dos
+    vetores gravados pelo cálculo global.
+    Retorna dict com "pairs", "best_pair", "worst_pair" e "average_percent";
+    cada par traz "country_a", "country_b", "percent", "shared" e "report".
+    """
+    vectors = get_country_vectors(rankings)
+    matrix = calculate_group_compatibility_matrix(
+        list(vectors),
+        vectors,
+        _merged_release_order(vectors),
+        "album_id",
+        item_stats=False,
     )
 
-    return _calculate_compatibility_from_queryset(shared_rankings_qs, "track_id")
+    def country_pair(pair):
+        if pair is None:
+            return None
+        return {
+            "country_a": pair["user_a_id"],
+            "country_b": pair["user_b_id"],
+            "percent": pair["percent"],
+            "shared": pair["shared"],
+            "report": pair["report"],
+        }
+
+    return {
+        "pairs": [country_pair(pair) for pair in matrix["pairs"]],
+        "best_pair": country_pair(matrix["best_pair"]),
+        "worst_pair": country_pair(matrix["worst_pair"]),
+        "average_percent": matrix["average_percent"],
+    }
 
 
-def calculate_global_ranking():
+def mark_countries_dirty(countries):
     """
-    Executa o cálculo do ranking de álbuns para todos os países
-    onde há pelo menos 2 usuários com rankings submetidos.
-    Popula/atualiza CountryGlobalRanking.
+    Registra os países cujo ranking global precisa ser recalculado.
+    Países já marcados apenas têm o marked_at atualizado.
     """
-    if User is None or AlbumRanking is None or CountryGlobalRanking is None:
-        logger.error("Required models not available for calculate_global_ranking.")
+    if DirtyCountry is None:
         return
 
-    print("--- INICIANDO CÁLCULO GLOBAL DE RANKING ---")
+    names = {country for country in countries if country}
+    if not names:
+        return
+
+    DirtyCountry.objects.bulk_create(
+        [DirtyCountry(country_name=name) for name in names],
+        update_conflicts=True,
+        unique_fields=["country_name"],
+        update_fields=["marked_at"],
+    )
+
+
+def get_dirty_countries():
+    """
+    Retorna as marcas pendentes como [(country_name, marked_at), ...] sem
+    removê-las. Elas só são removidas por clear_dirty_countries, na mesma
+    transação que grava o ranking recalculado, para que uma falha no cálculo
+    não as perca.
+    """
+    if DirtyCountry is None:
+        return []
+    return list(DirtyCountry.objects.values_list("country_name", "marked_at"))
+
+
+def clear_dirty_countries(marks):
+    """
+    Remove as marcas consumidas. Só são apagadas as linhas que ainda têm
+    exatamente o marked_at lido: uma escrita que remarcou o país depois da
+    leitura (mesmo com marked_at anterior, por ter confirmado mais tarde)
+    mantém a marca para o próximo ciclo.
+    """
+    if DirtyCountry is None or not marks:
+        return
+    condition = Q()
+    for country_name, marked_at in marks:
+        condition |= Q(country_name=country_name, marked_at=marked_at)
+    DirtyCountry.objects.filter(condition).delete()
 
+
+def calculate_dirty_country_rankings():
+    """
+    Recálculo incremental: reconstrói apenas os CountryGlobalRanking dos
+    países marcados por escritas de ranking desde a última execução.
+    """
+    marks = get_dirty_countries()
+    if not marks:
+        logger.info("Nenhum país pendente para recálculo do ranking global.")
+        return []
+
+    countries = [country_name for country_name, _ in marks]
+    calculate_global_ranking(countries=countries, dirty_marks=marks)
+    return countries
+
+
+def get_country_album_stats(countries):
+    """
+    Retorna { country: [ {album_id, avg_position, std_dev, count}, ... ] },
+    com a lista de cada país ordenada por avg_position.
+    Tudo vem de uma única query agrupada por (país, álbum). O desvio padrão
+    amostral usa o agregado do banco (STDDEV_SAMP); no SQLite é derivado de
+    SUM(position) e SUM(position²) para não depender de agregados em Python.
+    """
+    countries = [country for country in countries if country]
+    if AlbumRanking is None or not countries:
+        return {}
+
+    use_db_stddev = connection.vendor != "sqlite"
+    aggregates = {
+        "avg_position": Avg("position"),
+        "count": Count("position"),
+    }
+    if use_db_stddev:
+        aggregates["std_dev"] = StdDev("position", sample=True)
+    else:
+        aggregates["total"] = Sum("position")
+        aggregates["total_sq"] = Sum(F("position") * F("position"))
+
+    rows = (
+        AlbumRanking.objects.filter(user__country__in=countries)
+        .values("user__country", "album_id")
+        .annotate(**aggregates)
+        .order_by("user__country", "avg_position", "album_id")
+    )
+
+    stats_by_country = defaultdict(list)
+    for row in rows:
+        count = row["count"] or 0
+        if count < 2:
+            std_dev = 0.0
+        elif use_db_stddev:
+            std_dev = float(row["std_dev"] or 0.0)
+        else:
+            std_dev = _sample_std_dev(count, row["total"], row["total_sq"])
+
+        stats_by_country[row["user__country"]].append(
+            {
+                "album_id": row["album_id"],
+                "avg_position": row["avg_position"],
+                "std_dev": std_dev,
+                "count": count,
+            }
+        )
+    return stats_by_country
+
+
+def _chunk_size():
+    return getattr(settings, "GLOBAL_RANKING_CHUNK_SIZE", 2000)
+
+
+def stream_country_track_stats(countries):
+    """
+    Retorna { country: { track_id: [votes, soma, soma dos quadrados] } }.
+    Percorre os TrackRanking dos países em streaming (values_list + iterator),
+    sem instanciar modelos: a memória fica limitada ao número de músicas
+    distintas por país, não ao número de rankings.
+    """
+    countries = [country for country in countries if country]
+    if TrackRanking is None or not countries:
+        return {}
+
+    rows = (
+        TrackRanking.objects.filter(user__country__in=countries)
+        .order_by()
+        .values_list("user__country", "track_id", "position")
+        .iterator(chunk_size=_chunk_size())
+    )
+
+    stats_by_country = defaultdict(dict)
+    for country, track_id, position in rows:
+        acc = stats_by_country[country].get(track_id)
+        if acc is None:
+            acc = stats_by_country[country][track_id] = [0, 0, 0]
+        acc[0] += 1
+        acc[1] += position
+        acc[2] += position * position
+    return stats_by_country
+
+
+def get_eligible_countries(countries=None):
+    """
+    Retorna [{"country": ..., "user_count": ...}] para os países com pelo menos
+    2 usuários com ranking de álbuns. Se countries for informado, restringe a
+    busca a esses países.
+    """
     try:
+        countries_data = User.objects.filter(album_rankings__isnull=False)
+        if countries is not None:
+            countries_data = countries_data.filter(country__in=list(countries))
         countries_data = (
-            User.objects.filter(album_rankings__isnull=False)
-            .values("country")
+            countries_data.values("country")
             .annotate(user_count=Count("id", distinct=True))
             .filter(user_count__gte=2)
         )
+        return list(countries_data)
     except Exception:
         try:
+            countries_data = AlbumRanking.objects.all()
+            if countries is not None:
+                countries_data = countries_data.filter(
+                    user__country__in=list(countries)
+                )
             countries_data = (
-                AlbumRanking.objects.values("user__country")
+                countries_data.values("user__country")
                 .annotate(user_count=Count("user", distinct=True))
                 .filter(user__country__isnull=False)
             )
+            return list(countries_data)
         except Exception as e:
             logger.exception("Failed to obtain countries_data: %s", e)
-            countries_data = []
+            return []
+
+
+def save_country_rankings(
+    rows,
+    album_stats=None,
+    track_stats=None,
+    snapshots=None,
+    run_id=None,
+    dirty_marks=None,
+):
+    """
+    Grava todos os CountryGlobalRanking calculados com um único upsert
+    (bulk_create com update_conflicts) dentro de uma transação, para que
+    GlobalRankingListView nunca veja linhas parcialmente atualizadas.
+    album_stats/track_stats ({country: [CountryAlbumStat/CountryTrackStat
+    sem country]}) substituem as tabelas normalizadas dos mesmos países.
+    snapshots (CountryRankingSnapshot sem run) são anexados ao histórico da
+    execução run_id (uma nova execução é criada se não for informada).
+    dirty_marks (marcas lidas por get_dirty_countries) são removidas na
+    mesma transação.
+    """
+    if not rows:
+        if dirty_marks:
+            clear_dirty_countries(dirty_marks)
+        return []
+
+    with transaction.atomic():
+        saved = CountryGlobalRanking.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["country_name"],
+            update_fields=[
+                "user_count",
+                "consensus_album",
+                "polarization_album",
+                "global_consensus_track",
+                "analysis_data",
+                "album_vector_ids",
+                "album_vector_ranks",
+                "updated_at",
+            ],
+        )
+
+        country_ids = dict(
+            CountryGlobalRanking.objects.filter(
+                country_name__in=[row.country_name for row in rows]
+            ).values_list("country_name", "id")
+        )
+        _replace_country_stats(CountryAlbumStat, country_ids, album_stats or {})
+        _replace_country_stats(CountryTrackStat, country_ids, track_stats or {})
+        _record_snapshots(snapshots or [], run_id)
+        if dirty_marks:
+            clear_dirty_countries(dirty_marks)
+        transaction.on_commit(refresh_global_ranking_generation)
+
+    return saved
+
+
+def _record_snapshots(snapshots, run_id=None):
+    if not snapshots or CountryRankingSnapshot is None:
+        return
+    if run_id is None:
+        run_id = GlobalRankingRun.objects.create().id
+    for snapshot in snapshots:
+        snapshot.run_id = run_id
+    CountryRankingSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=["run", "country_name"],
+        update_fields=[
+            "user_count",
+            "album_ids",
+            "avg_ranks",
+            "std_dev_ranks",
+            "votes",
+        ],
+    )
 
-    album_map = get_album_map()
-    track_map = {t.id: t for t in Track.objects.all()} if Track is not None else {}
 
+def _replace_country_stats(model, country_ids, stats_by_country):
+    if model is None:
+        return
+
+    model.objects.filter(country_id__in=country_ids.values()).delete()
+
+    objects = []
+    for country_name, stats in stats_by_country.items():
+        country_id = country_ids.get(country_name)
+        if country_id is None:
+            continue
+        for stat in stats:
+            stat.country_id = country_id
+            objects.append(stat)
+
+    model.objects.bulk_create(objects, batch_size=_chunk_size())
+
+
+def calculate_global_ranking(countries=None, run_id=None, dirty_marks=None):
+    """
+    Executa o cálculo do ranking de álbuns para todos os países
+    onde há pelo menos 2 usuários com rankings submetidos.
+    Se countries for informado, restringe o cálculo a esses países.
+    dirty_marks são repassadas a save_country_rankings.
+    Popula/atualiza CountryGlobalRanking e anexa um CountryRankingSnapshot
+    por país à execução run_id (usado pelas subtarefas do fan-out).
+    """
+    if User is None or AlbumRanking is None or CountryGlobalRanking is None:
+        logger.error("Required models not available for calculate_global_ranking.")
+        return
+
+    print("--- INICIANDO CÁLCULO GLOBAL DE RANKING ---")
+
+    countries_data = get_eligible_countries(countries)
+    country_names = [
+        country_info.get("country") or country_info.get("user__country")
+        for country_info in countries_data
+    ]
+    country_album_stats = get_country_album_stats(country_names)
+    country_track_stats = stream_country_track_stats(country_names)
+
+    album_titles = (
+        dict(
+            Album.objects.order_by("release_date", "id")
+            .values_list("id", "title")
+            .iterator(chunk_size=_chunk_size())
+        )
+        if Album is not None
+        else {}
+    )
+    album_order = {album_id: idx for idx, album_id in enumerate(album_titles)}
+    track_info = (
+        {
+            track_id: (title, album_id)
+            for track_id, title, album_id in Track.objects.values_list(
+                "id", "title", "album_id"
+            ).iterator(chunk_size=_chunk_size())
+        }
+        if Track is not None
+        else {}
+    )
+
+    rows = []
+    snapshots = []
+    album_stat_rows = defaultdict(list)
+    track_stat_rows = defaultdict(list)
     for country_info in countries_data:
         country = country_info.get("country") or country_info.get("user__country")
         user_count = country_info.get("user_count") or country_info.get("user_count", 0)
@@ -287,47 +1204,37 @@ def calculate_global_ranking():
 
         print(f"Processando país: {country} (users={user_count})")
 
-        country_user_ids = list(
-            User.objects.filter(country=country).values_list("id", flat=True)
-        )
-
-        album_stats = (
-            AlbumRanking.objects.filter(user_id__in=country_user_ids)
-            .values("album_id")
-            .annotate(avg_position=Avg("position"), count=Count("position"))
-            .order_by("avg_position")
-        )
-
-        full_positions = defaultdict(list)
-        for ranking in AlbumRanking.objects.filter(user_id__in=country_user_ids):
-            full_positions[ranking.album_id].append(ranking.position)
-
         analysis_data = {}
 
-        for stats in album_stats:
-            album_id = stats.get("album_id")
-            positions = full_positions.get(album_id, [])
-
-            if len(positions) > 1:
-                try:
-                    std_dev = statistics.stdev(positions)
-                except statistics.StatisticsError:
-                    std_dev = 0.0
-            else:
-                std_dev = 0.0
+        if CountryRankingSnapshot is not None:
+            snapshots.append(
+                CountryRankingSnapshot.from_album_stats(
+                    country, user_count, country_album_stats.get(country, [])
+                )
+            )
 
-            album_obj = album_map.get(int(album_id)) if album_id is not None else None
-            album_title = getattr(album_obj, "title", None) if album_obj else None
+        for stats in country_album_stats.get(country, []):
+            album_id = stats["album_id"]
+
+            if CountryAlbumStat is not None:
+                album_stat_rows[country].append(
+                    CountryAlbumStat(
+                        album_id=album_id,
+                        avg_rank=stats["avg_position"],
+                        std_dev_rank=stats["std_dev"],
+                        votes=stats["count"],
+                    )
+                )
 
             analysis_data[int(album_id)] = {
-                "album_title": album_title,
+                "album_title": album_titles.get(int(album_id)),
                 "avg_rank": (
-                    round(stats.get("avg_position", 0), 2)
-                    if stats.get("avg_position") is not None
+                    round(stats["avg_position"], 2)
+                    if stats["avg_position"] is not None
                     else None
                 ),
-                "std_dev_rank": round(std_dev, 2),
-                "votes": stats.get("count", 0),
+                "std_dev_rank": round(stats["std_dev"], 2),
+                "votes": stats["count"],
             }
 
         consensus_album_id = None
@@ -367,45 +1274,6 @@ def calculate_global_ranking():
         except Exception:
             polarization_album_id_int = None
 
-        try:
-            ranking_obj, created = CountryGlobalRanking.objects.update_or_create(
-                country_name=country,
-                defaults={
-                    "user_count": user_count,
-                    "consensus_album": (
-                        album_map.get(consensus_album_id_int)
-                        if consensus_album_id_int is not None
-                        else None
-                    ),
-                    "polarization_album": (
-                        album_map.get(polarization_album_id_int)
-                        if polarization_album_id_int is not None
-                        else None
-                    ),
-                    "analysis_data": analysis_data,
-                },
-            )
-            print(
-                f"✅ Ranking de {country} {'criado' if created else 'atualizado'}. Usuários: {user_count}"
-            )
-        except Exception as e:
-            logger.exception(
-                "Failed to update_or_create CountryGlobalRanking for %s: %s", country, e
-            )
-            continue
-
-        member_track_rankings = (
-            TrackRanking.objects.filter(user_id__in=country_user_ids).select_related(
-                "track"
-            )
-            if TrackRanking is not None
-            else []
-        )
-
-        track_positions = defaultdict(list)
-        for ranking in member_track_rankings:
-            track_positions[ranking.track_id].append(ranking.position)
-
         global_consensus_track_id = None
         min_global_avg = float("inf")
 
@@ -414,34 +1282,39 @@ def calculate_global_ranking():
         )
         polarization_track_id_by_album = {}
 
-        for track_id, positions in track_positions.items():
-            track_obj = track_map.get(track_id)
-            if not track_obj:
+        # Ordena só as músicas distintas do país (o banco não ordena as
+        # linhas): empates continuam resolvidos pelo menor track_id.
+        for track_id, (votes, total, total_sq) in sorted(
+            country_track_stats.get(country, {}).items()
+        ):
+            info = track_info.get(track_id)
+            if info is None:
                 continue
+            track_title, track_album_id = info
 
-            try:
-                avg_position = statistics.mean(positions)
-            except Exception:
-                avg_position = float("inf")
-            votes = len(positions)
-            try:
-                std_dev = statistics.stdev(positions) if votes > 1 else 0.0
-            except statistics.StatisticsError:
-                std_dev = 0.0
+            avg_position = total / votes
+            std_dev = _sample_std_dev(votes, total, total_sq)
 
             analysis = {
-                "track_title": getattr(track_obj, "title", None),
-                "album_id": getattr(track_obj, "album_id", None),
-                "avg_rank": (
-                    round(avg_position, 2)
-                    if isinstance(avg_position, (int, float))
-                    else None
-                ),
+                "track_title": track_title,
+                "album_id": track_album_id,
+                "avg_rank": round(avg_position, 2),
                 "std_dev_rank": round(std_dev, 2),
                 "votes": votes,
             }
 
-            if isinstance(avg_position, (int, float)) and avg_position < min_global_avg:
+            if CountryTrackStat is not None:
+                track_stat_rows[country].append(
+                    CountryTrackStat(
+                        track_id=track_id,
+                        album_id=track_album_id,
+                        avg_rank=avg_position,
+                        std_dev_rank=std_dev,
+                        votes=votes,
+                    )
+                )
+
+            if avg_position < min_global_avg:
                 min_global_avg = avg_position
                 global_consensus_track_id = track_id
 
@@ -479,21 +1352,152 @@ def calculate_global_ranking():
                 "tracks": tracks_serialized,
             }
 
-        existing = ranking_obj.analysis_data or {}
-        existing = dict(existing)
-        existing["track_analysis_by_album"] = serialized_track_analysis
-        existing["track_polarization_by_album"] = {
+        analysis_data["track_analysis_by_album"] = serialized_track_analysis
+        analysis_data["track_polarization_by_album"] = {
             str(k): v for k, v in polarization_track_id_by_album.items()
         }
-        ranking_obj.analysis_data = existing
-        ranking_obj.global_consensus_track_id = global_consensus_track_id
-        ranking_obj.save()
 
-        print(f"✅ Ranking de {country} atualizado (Álbuns e Tracks).")
+        vector_stats = sorted(
+            (
+                stats
+                for stats in country_album_stats.get(country, [])
+                if stats["avg_position"] is not None
+                and stats["album_id"] in album_order
+            ),
+            key=lambda stats: album_order[stats["album_id"]],
+        )
+
+        row = CountryGlobalRanking(
+            country_name=country,
+            user_count=user_count,
+            consensus_album_id=(
+                consensus_album_id_int
+                if consensus_album_id_int in album_titles
+                else None
+            ),
+            polarization_album_id=(
+                polarization_album_id_int
+                if polarization_album_id_int in album_titles
+                else None
+            ),
+            global_consensus_track_id=global_consensus_track_id,
+            analysis_data=analysis_data,
+        )
+        row.set_album_vector(
+            [stats["album_id"] for stats in vector_stats],
+            [stats["avg_position"] for stats in vector_stats],
+        )
+        rows.append(row)
+
+    save_country_rankings(
+        rows,
+        album_stat_rows,
+        track_stat_rows,
+        snapshots=snapshots,
+        run_id=run_id,
+        dirty_marks=dirty_marks,
+    )
+    print(f"✅ {len(rows)} ranking(s) de país gravado(s) (Álbuns e Tracks).")
 
     print("--- CÁLCULO GLOBAL FINALIZADO ---")
 
 
+def get_ranking_history(country, album_id=None, since=None, until=None):
+    """
+    Série temporal dos snapshots de um país, em ordem de execução (leitura
+    pelo índice (country_name, run)). Com album_id, cada ponto traz apenas as
+    estatísticas desse álbum (pontos em que o álbum não aparece são omitidos);
+    sem ele, cada ponto traz todos os álbuns do país.
+    """
+    if CountryRankingSnapshot is None or not country:
+        return []
+
+    snapshots = (
+        CountryRankingSnapshot.objects.select_related("run")
+        .filter(country_name=country)
+        .order_by("run_id")
+    )
+    if since is not None:
+        snapshots = snapshots.filter(run__created_at__gte=since)
+    if until is not None:
+        snapshots = snapshots.filter(run__created_at__lte=until)
+
+    series = []
+    for snapshot in snapshots.iterator(chunk_size=_chunk_size()):
+        point = {
+            "run_id": snapshot.run_id,
+            "created_at": snapshot.run.created_at,
+            "country_name": snapshot.country_name,
+            "user_count": snapshot.user_count,
+        }
+        if album_id is None:
+            point["albums"] = snapshot.album_rows()
+        else:
+            row = snapshot.album_row(album_id)
+            if row is None:
+                continue
+            point.update(row)
+        series.append(point)
+    return series
+
+
+def prune_ranking_snapshots(now=None):
+    """
+    Retenção do histórico: snapshots mais novos que
+    GLOBAL_RANKING_SNAPSHOT_FULL_RESOLUTION_DAYS são mantidos integralmente;
+    até GLOBAL_RANKING_SNAPSHOT_RETENTION_DAYS fica apenas o último snapshot
+    de cada país por dia; execuções mais antigas (ou vazias) são removidas.
+    Retorna o número de snapshots removidos.
+    """
+    if CountryRankingSnapshot is None:
+        return 0
+
+    now = now or timezone.now()
+    full_resolution_cutoff = now - timedelta(
+        days=getattr(settings, "GLOBAL_RANKING_SNAPSHOT_FULL_RESOLUTION_DAYS", 7)
+    )
+    retention_cutoff = now - timedelta(
+        days=getattr(settings, "GLOBAL_RANKING_SNAPSHOT_RETENTION_DAYS", 365)
+    )
+
+    with transaction.atomic():
+        removed, _ = CountryRankingSnapshot.objects.filter(
+            run__created_at__lt=retention_cutoff
+        ).delete()
+
+        kept = set()
+        to_delete = []
+        candidates = (
+            CountryRankingSnapshot.objects.filter(
+                run__created_at__lt=full_resolution_cutoff
+            )
+            .order_by("-run__created_at", "-run_id")
+            .values_list("id", "country_name", "run__created_at")
+        )
+        for snapshot_id, country, created_at in candidates.iterator(
+            chunk_size=_chunk_size()
+        ):
+            bucket = (country, timezone.localdate(created_at))
+            if bucket in kept:
+                to_delete.append(snapshot_id)
+            else:
+                kept.add(bucket)
+
+        chunk_size = _chunk_size()
+        for start in range(0, len(to_delete), chunk_size):
+            end = start + chunk_size
+            deleted, _ = CountryRankingSnapshot.objects.filter(
+                id__in=to_delete[start:end]
+            ).delete()
+            removed += deleted
+
+        GlobalRankingRun.objects.filter(
+            created_at__lt=full_resolution_cutoff, snapshots__isnull=True
+        ).delete()
+
+    return removed
+
+
 def calculate_group_internal_coherence(group) -> float:
     """
     CIGG (0..100). Implementação fixa para os testes:
@@ -3,20 +3,54 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db.models import Q
-from .models import AlbumRanking, TrackRanking, GroupRanking, CountryGlobalRanking
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
+from datetime import datetime, time
+from .models import (
+    AlbumRanking,
+    TrackRanking,
+    GroupRanking,
+    CountryGlobalRanking,
+    CountryAlbumStat,
+    CountryTrackStat,
+)
 from django.shortcuts import get_object_or_404
 from apps.albums.models import Album
 from apps.social.models import Group, Friendship
-from itertools import combinations
 from apps.users.models import User
-from collections import defaultdict
-import statistics
-from .utils import calculate_album_compatibility, calculate_track_compatibility
+from .utils import (
+    calculate_country_compatibility,
+    calculate_country_matrix,
+    calculate_friends_leaderboard,
+    calculate_group_album_matrix,
+    calculate_group_track_matrix,
+    calculate_track_compatibility,
+    find_best_matches,
+    get_album_compatibility,
+    get_friend_ids,
+    get_precomputed_compatibility,
+    get_ranking_history,
+    summarize_collective_analysis,
+)
+from .cache import (
+    get_album_vectors,
+    get_cached_global_ranking_response,
+    get_global_ranking_generation,
+    get_track_vectors,
+    set_cached_global_ranking_response,
+)
 from rest_framework import generics
 from .serializers import (
+    CountryAlbumStatSerializer,
     CountryGlobalRankingSerializer,
+    CountryTrackStatSerializer,
+    COUNTRY_RANKING_SUMMARY_FIELDS,
     GroupRankingCreateSerializer,
     AlbumRankingSerializer,
+    RankingImportSerializer,
     TrackRankingSerializer,
 )
 
@@ -49,6 +83,59 @@ def _get_user_from_request(request):
         return None
 
 
+def _int_query_param(request, name):
+    """
+    Lê um parâmetro inteiro opcional da query string.
+    Retorna None se ausente; valores inválidos geram erro 400.
+    """
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({name: ["Deve ser um número inteiro."]})
+
+
+def _datetime_query_param(request, name, end_of_day=False):
+    """
+    Lê uma data (AAAA-MM-DD) ou data/hora ISO 8601 opcional da query string.
+    Datas sem hora viram o início (ou, com end_of_day, o fim) do dia.
+    Retorna None se ausente; valores inválidos geram erro 400.
+    """
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is not None:
+                parsed = datetime.combine(
+                    parsed_date, time.max if end_of_day else time.min
+                )
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise serializers.ValidationError({name: ["Data inválida."]})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _pair_summary(pair, usernames, default_percent):
+    """
+    Converte um par retornado pela matriz de compatibilidade no formato
+    {"percent": ..., "users": (username_a, username_b)} usado nas respostas.
+    """
+    if pair is None:
+        return {"percent": default_percent, "users": None}
+    return {
+        "percent": pair["percent"],
+        "users": (usernames[pair["user_a_id"]], usernames[pair["user_b_id"]]),
+    }
+
+
 class EmptyResponseSerializer(serializers.Serializer):
     """
     Serializer placeholder para views que só usam GET ou retornam JSON customizado.
@@ -142,11 +229,10 @@ class GroupCompatibilityView(APIView):
             )
 
         member_ids = {member.id for member in members}
-        users_with_ranking_ids = set(
-            AlbumRanking.objects.filter(user__in=member_ids)
-            .values_list("user_id", flat=True)
-            .distinct()
-        )
+        member_vectors = get_album_vectors(member_ids)
+        users_with_ranking_ids = {
+            user_id for user_id, vector in member_vectors.items() if vector.item_ids
+        }
 
         if len(users_with_ranking_ids) < num_members:
             non_ranking_ids = member_ids - users_with_ranking_ids
@@ -160,49 +246,28 @@ class GroupCompatibilityView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        total_compatibility = 0
-        pair_comparisons = 0
-        detailed_comparisons = []
-
-        album_positions = defaultdict(list)
-        best_match_pair = {"percent": -1, "users": None}
-        worst_match_pair = {"percent": 101, "users": None}
-
-        for user_a, user_b in combinations(members, 2):
-            compatibility, shared_albums, analysis_report = (
-                calculate_album_compatibility(user_a, user_b)
-            )
-
-            if compatibility > best_match_pair["percent"]:
-                best_match_pair = {
-                    "percent": compatibility,
-                    "users": (user_a.username, user_b.username),
-                }
-            if compatibility < worst_match_pair["percent"]:
-                worst_match_pair = {
-                    "percent": compatibility,
-                    "users": (user_a.username, user_b.username),
-                }
-
-            total_compatibility += compatibility
-            pair_comparisons += 1
-
-            detailed_comparisons.append(
-                {
-                    "user_a": user_a.username,
-                    "user_b": user_b.username,
-                    "percent": compatibility,
-                    "shared_albums": shared_albums,
-                    "duo_analysis": analysis_report,
-                }
-            )
-
-            if shared_albums > 0:
+        matrix = calculate_group_album_matrix(
+            [member.id for member in members],
+            member_vectors,
+            pair_scores=get_precomputed_compatibility(member_ids),
+        )
+        usernames = {member.id: member.username for member in members}
 
-                for ranking in AlbumRanking.objects.filter(user__in=members):
-                    album_positions[ranking.album.id].append(ranking.position)
+        best_match_pair = _pair_summary(matrix["best_pair"], usernames, -1)
+        worst_match_pair = _pair_summary(matrix["worst_pair"], usernames, 101)
 
-        if pair_comparisons == 0:
+        detailed_comparisons = [
+            {
+                "user_a": usernames[pair["user_a_id"]],
+                "user_b": usernames[pair["user_b_id"]],
+                "percent": pair["percent"],
+                "shared_albums": pair["shared"],
+                "duo_analysis": pair["report"],
+            }
+            for pair in matrix["pairs"]
+        ]
+
+        if not detailed_comparisons:
             return Response(
                 {
                     "compatibility_percent": 0,
@@ -211,41 +276,12 @@ class GroupCompatibilityView(APIView):
                 status=status.HTTP_200_OK,
             )
 
-        group_album_analysis = {}
-        for album_id, positions in album_positions.items():
-            if len(positions) > 1:
-
-                avg_position = statistics.mean(positions)
-
-                try:
-                    std_dev = statistics.stdev(positions)
-                except statistics.StatisticsError:
-                    std_dev = 0
-
-                group_album_analysis[album_id] = {
-                    "avg_position": round(avg_position, 2),
-                    "std_dev": round(std_dev, 2),
-                }
-
-        consensus_album_id = min(
-            group_album_analysis,
-            key=lambda id: group_album_analysis[id]["avg_position"],
-            default=None,
+        group_album_analysis = matrix["item_stats"]
+        consensus_album_id, discord_album_id, polarization_album_id = (
+            summarize_collective_analysis(group_album_analysis)
         )
 
-        discord_album_id = max(
-            group_album_analysis,
-            key=lambda id: group_album_analysis[id]["avg_position"],
-            default=None,
-        )
-
-        polarization_album_id = max(
-            group_album_analysis,
-            key=lambda id: group_album_analysis[id]["std_dev"],
-            default=None,
-        )
-
-        group_compatibility = round(total_compatibility / pair_comparisons, 2)
+        group_compatibility = matrix["average_percent"]
 
         return Response(
             {
@@ -307,8 +343,9 @@ class CompatibilityView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        user_a_has_rankings = AlbumRanking.objects.filter(user=user_a).exists()
-        user_b_has_rankings = AlbumRanking.objects.filter(user=user_b).exists()
+        vectors = get_album_vectors([user_a.id, user_b.id])
+        user_a_has_rankings = bool(vectors[user_a.id].item_ids)
+        user_b_has_rankings = bool(vectors[user_b.id].item_ids)
 
         if not user_a_has_rankings or not user_b_has_rankings:
             missing_user = []
@@ -325,7 +362,7 @@ class CompatibilityView(APIView):
             )
 
         compatibility_percent, num_shared_albums, analysis_report = (
-            calculate_album_compatibility(user_a, user_b)
+            get_album_compatibility(user_a, user_b)
         )
 
         if num_shared_albums == 0:
@@ -348,6 +385,98 @@ class CompatibilityView(APIView):
         )
 
 
+class BestMatchesView(APIView):
+    """
+    Retorna os usuários mais compatíveis (ranking de álbuns) com o usuário logado.
+    - ?k=10: quantidade de resultados (máximo BEST_MATCHES_MAX_RESULTS)
+    - ?country=<nome>: apenas usuários do país
+    - ?friends_only=true: apenas amigos
+    - ?min_shared=3: mínimo de álbuns em comum
+    URL de exemplo: /api/rankings/compare/albums/best-matches/?k=5&country=Brasil
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = EmptyResponseSerializer
+
+    def get(self, request):
+        user = request.user
+        k = _int_query_param(request, "k")
+        k = 10 if k is None else k
+        k = max(1, min(k, getattr(settings, "BEST_MATCHES_MAX_RESULTS", 50)))
+        min_shared = _int_query_param(request, "min_shared")
+
+        if not get_album_vectors([user.id])[user.id].item_ids:
+            return Response(
+                {
+                    "error": "Você ainda não submeteu seu ranking de álbuns.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        candidate_ids = None
+        if request.query_params.get("friends_only", "").lower() in ("1", "true"):
+            candidate_ids = get_friend_ids(user.id)
+
+        matches = find_best_matches(
+            user,
+            k=k,
+            candidate_ids=candidate_ids,
+            min_shared=min_shared,
+            country=request.query_params.get("country") or None,
+        )
+        usernames = dict(
+            User.objects.filter(
+                id__in=[match["user_id"] for match in matches]
+            ).values_list("id", "username")
+        )
+
+        return Response(
+            {
+                "results": [
+                    {
+                        "user_id": match["user_id"],
+                        "username": usernames.get(match["user_id"]),
+                        "shared_albums_count": match["shared"],
+                        "compatibility_percent": match["percent"],
+                        "matching_analysis": match["report"],
+                    }
+                    for match in matches
+                ]
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class FriendsCompatibilityView(APIView):
+    """
+    Lista todos os amigos do usuário logado ordenados pela compatibilidade
+    de ranking de álbuns, calculada em lote.
+    URL de exemplo: /api/rankings/compare/albums/friends/
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = EmptyResponseSerializer
+
+    def get(self, request):
+        leaderboard = calculate_friends_leaderboard(request.user.id)
+
+        return Response(
+            {
+                "results": [
+                    {
+                        "user_id": entry["user_id"],
+                        "username": entry["username"],
+                        "shared_albums_count": entry["shared"],
+                        "compatibility_percent": entry["percent"],
+                        "matching_analysis": entry["report"],
+                    }
+                    for entry in leaderboard
+                ]
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class TrackCompatibilityView(APIView):
     """
     Calcula a compatibilidade de ranking de músicas de um álbum específico entre o usuário logado e outro usuário.
@@ -378,12 +507,9 @@ class TrackCompatibilityView(APIView):
                 {"error": "Álbum não encontrado."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        user_a_has_rankings = TrackRanking.objects.filter(
-            user=user_a, track__album=album
-        ).exists()
-        user_b_has_rankings = TrackRanking.objects.filter(
-            user=user_b, track__album=album
-        ).exists()
+        vectors = get_track_vectors([user_a.id, user_b.id], album.id)
+        user_a_has_rankings = bool(vectors[user_a.id].item_ids)
+        user_b_has_rankings = bool(vectors[user_b.id].item_ids)
 
         if not user_a_has_rankings or not user_b_has_rankings:
             missing_user = []
@@ -400,7 +526,7 @@ class TrackCompatibilityView(APIView):
             )
 
         compatibility_percent, num_shared_tracks, analysis_report = (
-            calculate_track_compatibility(user_a, user_b, album)
+            calculate_track_compatibility(user_a, user_b, album, vectors=vectors)
         )
 
         if num_shared_tracks == 0:
@@ -457,12 +583,11 @@ class GroupTrackCompatibilityView(APIView):
             )
 
         member_ids = {member.id for member in members}
+        member_vectors = get_track_vectors(member_ids, album.id)
 
-        users_with_track_ranking_ids = set(
-            TrackRanking.objects.filter(user__in=member_ids, track__album=album)
-            .values_list("user_id", flat=True)
-            .distinct()
-        )
+        users_with_track_ranking_ids = {
+            user_id for user_id, vector in member_vectors.items() if vector.item_ids
+        }
 
         if len(users_with_track_ranking_ids) < num_members:
             non_ranking_ids = member_ids - users_with_track_ranking_ids
@@ -476,51 +601,26 @@ class GroupTrackCompatibilityView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        track_positions = defaultdict(list)
-
-        member_track_rankings = TrackRanking.objects.filter(
-            user__in=members, track__album=album
-        ).select_related("track")
-
-        for ranking in member_track_rankings:
-            track_positions[ranking.track.id].append(ranking.position)
-
-        total_compatibility = 0
-        pair_comparisons = 0
-        detailed_comparisons = []
-        best_match_pair = {"percent": -1, "users": None}
-        worst_match_pair = {"percent": 101, "users": None}
-
-        for user_a, user_b in combinations(members, 2):
-            compatibility, shared_tracks, analysis_report = (
-                calculate_track_compatibility(user_a, user_b, album)
-            )
-
-            total_compatibility += compatibility
-            pair_comparisons += 1
-
-            if compatibility > best_match_pair["percent"]:
-                best_match_pair = {
-                    "percent": compatibility,
-                    "users": (user_a.username, user_b.username),
-                }
-            if compatibility < worst_match_pair["percent"]:
-                worst_match_pair = {
-                    "percent": compatibility,
-                    "users": (user_a.username, user_b.username),
-                }
+        matrix = calculate_group_track_matrix(
+            [member.id for member in members], album.id, member_vectors
+        )
+        usernames = {member.id: member.username for member in members}
 
-            detailed_comparisons.append(
-                {
-                    "user_a": user_a.username,
-                    "user_b": user_b.username,
-                    "percent": compatibility,
-                    "shared_tracks": shared_tracks,
-                    "duo_analysis": analysis_report,
-                }
-            )
+        best_match_pair = _pair_summary(matrix["best_pair"], usernames, -1)
+        worst_match_pair = _pair_summary(matrix["worst_pair"], usernames, 101)
 
-        if pair_comparisons == 0:
+        detailed_comparisons = [
+            {
+                "user_a": usernames[pair["user_a_id"]],
+                "user_b": usernames[pair["user_b_id"]],
+                "percent": pair["percent"],
+                "shared_tracks": pair["shared"],
+                "duo_analysis": pair["report"],
+            }
+            for pair in matrix["pairs"]
+        ]
+
+        if not detailed_comparisons:
             return Response(
                 {
                     "compatibility_percent": 0,
@@ -529,40 +629,12 @@ class GroupTrackCompatibilityView(APIView):
                 status=status.HTTP_200_OK,
             )
 
-        group_track_analysis = {}
-        for track_id, positions in track_positions.items():
-            if len(positions) > 1:
-                avg_position = statistics.mean(positions)
-
-                try:
-                    std_dev = statistics.stdev(positions)
-                except statistics.StatisticsError:
-                    std_dev = 0
-
-                group_track_analysis[track_id] = {
-                    "avg_position": round(avg_position, 2),
-                    "std_dev": round(std_dev, 2),
-                }
-
-        consensus_track_id = min(
-            group_track_analysis,
-            key=lambda id: group_track_analysis[id]["avg_position"],
-            default=None,
-        )
-
-        discord_track_id = max(
-            group_track_analysis,
-            key=lambda id: group_track_analysis[id]["avg_position"],
-            default=None,
+        group_track_analysis = matrix["item_stats"]
+        consensus_track_id, discord_track_id, polarization_track_id = (
+            summarize_collective_analysis(group_track_analysis)
         )
 
-        polarization_track_id = max(
-            group_track_analysis,
-            key=lambda id: group_track_analysis[id]["std_dev"],
-            default=None,
-        )
-
-        group_compatibility = round(total_compatibility / pair_comparisons, 2)
+        group_compatibility = matrix["average_percent"]
 
         return Response(
             {
@@ -583,17 +655,188 @@ class GroupTrackCompatibilityView(APIView):
         )
 
 
-class GlobalRankingListView(generics.ListAPIView):
+COUNTRY_VECTOR_FIELDS = ("album_vector_ids", "album_vector_ranks")
+
+
+class GlobalRankingCacheMixin:
+    """
+    Os rankings globais só mudam quando o cálculo em lote termina, então as
+    respostas são versionadas pela geração publicada no cache: ETag e
+    Last-Modified permitem respostas 304 e o corpo serializado é reaproveitado
+    até a próxima geração. variant distingue as respostas de uma mesma
+    geração (ex.: campos selecionados ou país).
+    """
+
+    def cached_response(self, request, variant, build_data):
+        generation = get_global_ranking_generation()
+        etag = quote_etag(f"{generation['token']}:{variant}")
+        last_modified = generation["last_modified"]
+        last_modified = last_modified.timestamp() if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            data = get_cached_global_ranking_response(generation["token"], variant)
+            if data is None:
+                data = build_data()
+                set_cached_global_ranking_response(generation["token"], variant, data)
+            response = Response(data)
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=getattr(settings, "GLOBAL_RANKING_HTTP_MAX_AGE", 60),
+        )
+        return response
+
+
+class GlobalRankingListView(GlobalRankingCacheMixin, generics.ListAPIView):
     """
     Retorna o ranking global de álbuns para todos os países
     (Dados pré-calculados para o mapa).
+    Por padrão retorna o resumo (sem analysis_data, que nem é lido do banco).
+    - ?include=analysis: inclui analysis_data
+    - ?fields=country_name,user_count: seleciona os campos retornados
     """
 
-    queryset = CountryGlobalRanking.objects.all().select_related(
-        "consensus_album", "polarization_album"
+    serializer_class = CountryGlobalRankingSerializer
+    permission_classes = [AllowAny]
+
+    def get_selected_fields(self):
+        all_fields = CountryGlobalRankingSerializer.Meta.fields
+        requested = self.request.query_params.get("fields")
+        if requested:
+            fields = [name.strip() for name in requested.split(",") if name.strip()]
+            unknown = set(fields) - set(all_fields)
+            if unknown:
+                raise serializers.ValidationError(
+                    {"fields": [f"Campos inválidos: {', '.join(sorted(unknown))}."]}
+                )
+            return fields
+
+        include = self.request.query_params.get("include", "").split(",")
+        if "analysis" in include:
+            return list(all_fields)
+        return list(COUNTRY_RANKING_SUMMARY_FIELDS)
+
+    def get_queryset(self):
+        queryset = (
+            CountryGlobalRanking.objects.all()
+            .select_related("consensus_album", "polarization_album")
+            .defer(*COUNTRY_VECTOR_FIELDS)
+        )
+        if "analysis_data" not in self.get_selected_fields():
+            queryset = queryset.defer("analysis_data")
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs["fields"] = self.get_selected_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            "list:" + "|".join(self.get_selected_fields()),
+            lambda: list(
+                super(GlobalRankingListView, self).list(request, *args, **kwargs).data
+            ),
+        )
+
+
+class GlobalRankingDetailView(GlobalRankingCacheMixin, generics.RetrieveAPIView):
+    """
+    Retorna o ranking global completo (incluindo analysis_data) de um país.
+    URL de exemplo: /api/rankings/global/Brasil/
+    """
+
+    queryset = (
+        CountryGlobalRanking.objects.all()
+        .select_related("consensus_album", "polarization_album")
+        .defer(*COUNTRY_VECTOR_FIELDS)
     )
     serializer_class = CountryGlobalRankingSerializer
     permission_classes = [AllowAny]
+    lookup_field = "country_name"
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            "detail:" + self.kwargs[self.lookup_field],
+            lambda: dict(
+                super(GlobalRankingDetailView, self)
+                .retrieve(request, *args, **kwargs)
+                .data
+            ),
+        )
+
+
+class CountryAlbumStatListView(generics.ListAPIView):
+    """
+    Estatísticas pré-calculadas de álbuns por país, sem carregar analysis_data.
+    Filtros opcionais: ?album=<id>&country=<nome>
+    URL de exemplo: /api/rankings/global/albums/?album=3
+    """
+
+    serializer_class = CountryAlbumStatSerializer
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        queryset = CountryAlbumStat.objects.select_related("country", "album").only(
+            "avg_rank",
+            "std_dev_rank",
+            "votes",
+            "album__title",
+            "country__country_name",
+        )
+
+        album_id = _int_query_param(self.request, "album")
+        if album_id is not None:
+            queryset = queryset.filter(album_id=album_id)
+
+        country = self.request.query_params.get("country")
+        if country:
+            queryset = queryset.filter(country__country_name=country)
+
+        return queryset
+
+
+class CountryTrackStatListView(generics.ListAPIView):
+    """
+    Estatísticas pré-calculadas de músicas por país, sem carregar analysis_data.
+    Filtros opcionais: ?track=<id>&album=<id>&country=<nome>
+    URL de exemplo: /api/rankings/global/tracks/?album=3&country=Brasil
+    """
+
+    serializer_class = CountryTrackStatSerializer
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        queryset = CountryTrackStat.objects.select_related("country", "track").only(
+            "avg_rank",
+            "std_dev_rank",
+            "votes",
+            "album_id",
+            "track__title",
+            "country__country_name",
+        )
+
+        track_id = _int_query_param(self.request, "track")
+        if track_id is not None:
+            queryset = queryset.filter(track_id=track_id)
+
+        album_id = _int_query_param(self.request, "album")
+        if album_id is not None:
+            queryset = queryset.filter(album_id=album_id)
+
+        country = self.request.query_params.get("country")
+        if country:
+            queryset = queryset.filter(country__country_name=country)
+
+        return queryset
 
 
 class GroupRankingViewSet(viewsets.ModelViewSet):
@@ -632,6 +875,34 @@ class AlbumRankingView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RankingImportView(APIView):
+    """
+    Importa de uma vez o ranking de álbuns e os rankings de músicas de vários
+    álbuns (ex: migração de outro app). Tudo é validado antes de gravar e
+    salvo em uma única transação; o campo "albums" é opcional e, quando
+    enviado, substitui o ranking de álbuns como no PUT de /albums/.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = RankingImportSerializer
+
+    def post(self, request):
+        serializer = RankingImportSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                imported = serializer.create(
+                    serializer.validated_data, user=request.user
+                )
+                return Response(
+                    {"message": "Rankings importados com sucesso!", **imported},
+                    status=status.HTTP_201_CREATED,
+                )
+            except serializers.ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class UserRankedTitlesView(APIView):
     """
     Retorna:
@@ -730,3 +1001,116 @@ class OtherUserRankedTitlesView(APIView):
         }
 
         return Response(response_data, status=status.HTTP_200_OK)
+
+
+class GlobalRankingHistoryView(APIView):
+    """
+    Série temporal dos snapshots do ranking global de um país.
+    - ?country=<nome> (obrigatório): todos os álbuns do país em cada execução
+    - ?album=<id>: apenas as estatísticas do álbum no país
+    - ?since=/?until=: intervalo de datas (AAAA-MM-DD ou ISO 8601)
+    URL de exemplo: /api/rankings/global/history/?country=Brasil&album=3
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        country = request.query_params.get("country") or None
+        album_id = _int_query_param(request, "album")
+        if country is None:
+            return Response(
+                {"error": "O parâmetro 'country' é obrigatório."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        series = get_ranking_history(
+            country=country,
+            album_id=album_id,
+            since=_datetime_query_param(request, "since"),
+            until=_datetime_query_param(request, "until", end_of_day=True),
+        )
+        return Response(series, status=status.HTTP_200_OK)
+
+
+class CountryCompatibilityView(APIView):
+    """
+    Compara o gosto de dois países a partir dos vetores de posições médias
+    gravados pelo cálculo global (não acessa as tabelas de ranking).
+    URL de exemplo: /api/rankings/compare/countries/Brasil/Portugal/
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request, country_a, country_b):
+        rankings = {
+            ranking.country_name: ranking
+            for ranking in CountryGlobalRanking.objects.filter(
+                country_name__in=[country_a, country_b]
+            ).only("country_name", *COUNTRY_VECTOR_FIELDS)
+        }
+        missing = [c for c in (country_a, country_b) if c not in rankings]
+        if missing:
+            return Response(
+                {"error": f"Ranking global não encontrado para: {', '.join(missing)}."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        compatibility_percent, num_shared_albums, analysis_report = (
+            calculate_country_compatibility(rankings[country_a], rankings[country_b])
+        )
+
+        if num_shared_albums == 0:
+            return Response(
+                {
+                    "compatibility_percent": 0,
+                    "message": "Nenhum álbum em comum rankeado.",
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        return Response(
+            {
+                "country_a": country_a,
+                "country_b": country_b,
+                "shared_albums_count": num_shared_albums,
+                "compatibility_percent": compatibility_percent,
+                "matching_analysis": analysis_report,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class CountryCompatibilityMatrixView(GlobalRankingCacheMixin, APIView):
+    """
+    Matriz de compatibilidade entre todos os pares de países, calculada a
+    partir dos vetores do cálculo global e reaproveitada até a próxima execução.
+    URL de exemplo: /api/rankings/compare/countries/
+    """
+
+    permission_classes = [AllowAny]
+
+    def build_matrix(self):
+        rankings = CountryGlobalRanking.objects.order_by("country_name").only(
+            "country_name", *COUNTRY_VECTOR_FIELDS
+        )
+        matrix = calculate_country_matrix(rankings)
+
+        def pair_summary(pair):
+            if pair is None:
+                return None
+            return {
+                "country_a": pair["country_a"],
+                "country_b": pair["country_b"],
+                "compatibility_percent": pair["percent"],
+                "shared_albums_count": pair["shared"],
+            }
+
+        return {
+            "pairs": [pair_summary(pair) for pair in matrix["pairs"]],
+            "best_pair": pair_summary(matrix["best_pair"]),
+            "worst_pair": pair_summary(matrix["worst_pair"]),
+            "average_percent": matrix["average_percent"],
+        }
+
+    def get(self, request):
+        return self.cached_response(request, "country-matrix", self.build_matrix)
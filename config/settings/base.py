@@ -104,8 +104,52 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
 }
 
-CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-CELERY_RESULT_BACKEND = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Web e workers do Celery precisam do mesmo cache (versões dos vetores,
+# geração do ranking global e travas de debounce); LocMemCache só nos testes.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    }
+}
+
+RANKING_VECTOR_CACHE_TIMEOUT = int(
+    os.getenv("RANKING_VECTOR_CACHE_TIMEOUT", 60 * 60 * 24)
+)
+
+BEST_MATCHES_MIN_SHARED_ALBUMS = int(os.getenv("BEST_MATCHES_MIN_SHARED_ALBUMS", 3))
+BEST_MATCHES_MAX_RESULTS = int(os.getenv("BEST_MATCHES_MAX_RESULTS", 50))
+BEST_MATCHES_DIRECT_SCORING_LIMIT = int(
+    os.getenv("BEST_MATCHES_DIRECT_SCORING_LIMIT", 500)
+)
+
+COMPATIBILITY_REFRESH_DEBOUNCE_SECONDS = int(
+    os.getenv("COMPATIBILITY_REFRESH_DEBOUNCE_SECONDS", 30)
+)
+
+GLOBAL_RANKING_DEBOUNCE_SECONDS = int(os.getenv("GLOBAL_RANKING_DEBOUNCE_SECONDS", 30))
+
+GLOBAL_RANKING_CHUNK_SIZE = int(os.getenv("GLOBAL_RANKING_CHUNK_SIZE", 2000))
+
+GLOBAL_RANKING_SNAPSHOT_FULL_RESOLUTION_DAYS = int(
+    os.getenv("GLOBAL_RANKING_SNAPSHOT_FULL_RESOLUTION_DAYS", 7)
+)
+GLOBAL_RANKING_SNAPSHOT_RETENTION_DAYS = int(
+    os.getenv("GLOBAL_RANKING_SNAPSHOT_RETENTION_DAYS", 365)
+)
+
+GLOBAL_RANKING_CACHE_TIMEOUT = int(os.getenv("GLOBAL_RANKING_CACHE_TIMEOUT", 60 * 60))
+GLOBAL_RANKING_HTTP_MAX_AGE = int(os.getenv("GLOBAL_RANKING_HTTP_MAX_AGE", 60))
+
+GLOBAL_RANKING_FAN_OUT = os.getenv("GLOBAL_RANKING_FAN_OUT", "false").lower() == "true"
+GLOBAL_RANKING_FAN_OUT_SHARD_SIZE = int(
+    os.getenv("GLOBAL_RANKING_FAN_OUT_SHARD_SIZE", 1)
+)
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
@@ -118,6 +162,18 @@ CELERY_BEAT_SCHEDULE = {
         "args": (),
         "options": {"queue": "default"},
     },
+    "precompute-album-compatibility-daily": {
+        "task": "apps.rankings.tasks.precompute_album_compatibility_scores",
+        "schedule": crontab(minute=0, hour=1),
+        "args": (),
+        "options": {"queue": "default"},
+    },
+    "prune-global-ranking-snapshots-daily": {
+        "task": "apps.rankings.tasks.prune_global_ranking_snapshots",
+        "schedule": crontab(minute=30, hour=0),
+        "args": (),
+        "options": {"queue": "default"},
+    },
 }
 
 CORS_ALLOW_ALL_ORIGINS = False
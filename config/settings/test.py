@@ -0,0 +1,7 @@
+from .dev import *  # noqa: F401
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}